@@ -258,9 +258,64 @@ function renderPreview(fh) {
 }
 
 
+// Versions of the narrative and nuggets last fetched, by URL
+var versioned = {}
+
+function applyPatch(doc, patch) {
+  // Apply a JSON patch (RFC 6902) with add, remove and replace operations.
+  patch.forEach((op) => {
+    if (!op.path) {
+      doc = op.value
+      return
+    }
+    let keys = op.path.split('/').slice(1).map((k) => k.replace(/~1/g, '/').replace(/~0/g, '~'))
+    let parent = keys.slice(0, -1).reduce((obj, key) => obj[key], doc)
+    let key = keys[keys.length - 1]
+    if (Array.isArray(parent)) {
+      key = key == '-' ? parent.length : parseInt(key)
+      if (op.op == 'remove')
+        parent.splice(key, 1)
+      else
+        parent.splice(key, op.op == 'add' ? 0 : 1, op.value)
+    } else if (op.op == 'remove') {
+      delete parent[key]
+    } else {
+      parent[key] = op.value
+    }
+  })
+  return doc
+}
+
+var versionedRequests = {}
+
+function getVersioned(url, key) {
+  // Fetch a JSON resource as a patch against the version we have, stored under key.
+  // Requests for a key run one after another, so that each patch is made against the
+  // version that the previous request stored.
+  let request = $.when(versionedRequests[key]).then(() => fetchVersioned(url, key))
+  versionedRequests[key] = request.then(null, () => null)
+  return request
+}
+
+function fetchVersioned(url, key) {
+  let known = versioned[key] || {version: '', value: null}
+  return $.getJSON(url, {_version: known.version}).then((e) => {
+    if (e.base !== null && e.base !== known.version) {
+      // The patch isn't against our version. Get the whole resource, whose path is the key.
+      delete versioned[key]
+      return fetchVersioned(`${nlg_base}/${key}`, key)
+    }
+    // Patch a copy, so that a failed patch leaves the stored version intact
+    let base = e.base === null ? null : JSON.parse(JSON.stringify(known.value))
+    let value = applyPatch(base, e.patch)
+    versioned[key] = {version: e.version, value: value}
+    return JSON.parse(JSON.stringify(value))
+  })
+}
+
 function refreshTemplate(n) {
   // Refresh the nth template from the backend
-  $.getJSON(`${nlg_base}/nuggets/${n}`).done((e) => {
+  getVersioned(`${nlg_base}/nuggets/${n}`, `nuggets/${n}`).done((e) => {
     templates[n] = new Template(e)
     $('#tmpl-setting-preview').html(templates[n].previewHTML())
     renderPreview(null)
@@ -270,7 +325,7 @@ function refreshTemplate(n) {
 function refreshTemplates() {
   // Refresh the output of all templates in the current narrative.
   templates = []
-  $.getJSON(`${nlg_base}/narratives`).done((e) => {
+  getVersioned(`${nlg_base}/narratives`, 'narratives').done((e) => {
     if (e.narrative.length > 0) {
       for (let i=0; i<e.narrative.length;i++) {
         refreshTemplate(i)
@@ -283,7 +338,7 @@ function refreshTemplates() {
 
 function deleteTemplate(n) {
   // Delete a template
-  $.getJSON(`${nlg_base}/nuggets/${n}?delete`).done(refreshTemplates)
+  getVersioned(`${nlg_base}/nuggets/${n}?delete`, 'narratives').done(refreshTemplates)
 }
 
 function triggerTemplateSettings(sentid) {
@@ -332,12 +387,21 @@ function embedNarrative(url, nname, selector) {
 }
 
 
+function toColumns(rows) {
+  // Convert row records into {column: [values]}, which is much smaller to post.
+  let columns = {}
+  if (rows.length)
+    Object.keys(rows[0]).forEach((key) => {columns[key] = rows.map((row) => row[key])})
+  return columns
+}
+
+
 function renderLiveNarrative(url, nname, selector) {
   $.getJSON(url).done((e) => {
     $.post(
       `${nlg_base}/render-live-template`,
       JSON.stringify({
-        data: e,
+        data: toColumns(e),
         nrid: nname
       }),
       (f) => {$(selector).html(f)}
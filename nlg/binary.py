@@ -0,0 +1,194 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Compact binary storage for narratives.
+
+A narrative file starts with a header, followed by one zlib-compressed JSON blob per
+nugget::
+
+    b'NLGN' | version (uint16) | index length (uint32) | index (JSON) | blob | blob | ...
+
+The index holds the style of the narrative and the offset, length, name, columns and
+number of tokens of each nugget. `nlg.binary.load` reads only the index. Nuggets are
+deserialized when they are first accessed.
+"""
+import json
+import struct
+import zlib
+
+from nlg.narrative import Narrative, Nugget
+
+MAGIC = b'NLGN'
+VERSION = 1
+_HEADER = struct.Struct('<4sHI')
+
+
+class _NuggetRef(object):
+    """Placeholder for a nugget which hasn't been deserialized yet."""
+
+    __slots__ = ('data', 'info')
+
+    def __init__(self, data, info):
+        self.data = data
+        self.info = info
+
+    def load(self):
+        start = self.info['offset']
+        try:
+            blob = zlib.decompress(self.data[start:start + self.info['length']])
+        except zlib.error as e:
+            raise ValueError(f'Corrupt nugget in narrative file: {e}') from e
+        return Nugget.from_json(json.loads(blob.decode('utf8')))
+
+
+class LazyNarrative(Narrative):
+    """A narrative whose nuggets are loaded from a binary file only when accessed.
+
+    Use `nlg.binary.load` or `nlg.binary.loads` to create one.
+    """
+
+    def _load(self, i):
+        item = list.__getitem__(self, i)
+        if isinstance(item, _NuggetRef):
+            item = item.load()
+            list.__setitem__(self, i, item)
+        return item
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._load(j) for j in range(*i.indices(len(self)))]
+        return self._load(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._load(i)
+
+    def __reversed__(self):
+        for i in reversed(range(len(self))):
+            yield self._load(i)
+
+    def copy(self):
+        return self[:]
+
+    def pop(self, i=-1):
+        self._load(i)
+        return super(LazyNarrative, self).pop(i)
+
+    @property
+    def loaded(self):
+        """Number of nuggets which have been deserialized."""
+        return sum(not isinstance(c, _NuggetRef) for c in list.__iter__(self))
+
+    @property
+    def ntokens(self):
+        """Number of tokens in the docs of all nuggets, read from the index for unloaded
+        nuggets."""
+        total = 0
+        for i, item in enumerate(list.__iter__(self)):
+            if isinstance(item, _NuggetRef) and item.info.get('tokens') is not None:
+                total += item.info['tokens']
+            else:
+                total += len(self._load(i).doc)
+        return total
+
+    @property
+    def columns(self):
+        # Read the columns of unloaded nuggets from the index
+        columns = set()
+        for item in list.__iter__(self):
+            used = item.info['columns'] if isinstance(item, _NuggetRef) else item.columns
+            if used is None:
+                return None
+            columns |= set(used)
+        return columns
+
+
+def dumps(narrative, doc=True):
+    """Serialize a narrative into the binary format.
+
+    Parameters
+    ----------
+    narrative : nlg.narrative.Narrative or dict
+        The narrative, or its JSON representation (see `nlg.narrative.Narrative.to_dict`).
+    doc : bool, optional
+        Whether to store the parsed spaCy docs of nuggets, so that loading them needs no
+        parsing. Ignored if `narrative` is a dict.
+
+    Returns
+    -------
+    bytes
+    """
+    tokens = None
+    if isinstance(narrative, Narrative):
+        tokens = [len(nugget.doc) for nugget in narrative]
+        narrative = narrative.to_dict(doc=doc)
+    blobs, nuggets, offset = [], [], 0
+    for i, nugget in enumerate(narrative['narrative']):
+        blob = zlib.compress(json.dumps(nugget, separators=(',', ':')).encode('utf8'))
+        nuggets.append({'offset': offset, 'length': len(blob), 'name': nugget.get('name', ''),
+                        'columns': nugget.get('columns'),
+                        'tokens': None if tokens is None else tokens[i]})
+        blobs.append(blob)
+        offset += len(blob)
+    index = {'style': narrative.get('style', Narrative.default_style), 'nuggets': nuggets}
+    index = json.dumps(index, separators=(',', ':')).encode('utf8')
+    return b''.join([_HEADER.pack(MAGIC, VERSION, len(index)), index] + blobs)
+
+
+def loads(data):
+    """Open a narrative serialized with `nlg.binary.dumps`.
+
+    Parameters
+    ----------
+    data : bytes
+
+    Returns
+    -------
+    nlg.binary.LazyNarrative
+    """
+    try:
+        magic, version, size = _HEADER.unpack_from(data)
+    except struct.error as e:
+        raise ValueError(f'Narrative file is too short: {e}') from e
+    if magic != MAGIC:
+        raise ValueError('Not an NLG narrative file.')
+    if version > VERSION:
+        raise ValueError(f'Unsupported narrative file version: {version}')
+    start = _HEADER.size + size
+    if len(data) < start:
+        raise ValueError('Narrative file is truncated.')
+    # json.JSONDecodeError and UnicodeDecodeError are ValueErrors
+    index = json.loads(bytes(data[_HEADER.size:start]).decode('utf8'))
+    blobs = memoryview(data)[start:]
+    for info in index['nuggets']:
+        if info['offset'] + info['length'] > len(blobs):
+            raise ValueError('Narrative file is truncated.')
+    narrative = LazyNarrative(_NuggetRef(blobs, info) for info in index['nuggets'])
+    narrative.html_style = index['style']
+    return narrative
+
+
+def dump(narrative, path, doc=True):
+    """Save a narrative to a binary file. See `nlg.binary.dumps`."""
+    with open(path, 'wb') as fout:
+        fout.write(dumps(narrative, doc))
+
+
+def load(path):
+    """Open a binary narrative file. See `nlg.binary.loads`."""
+    with open(path, 'rb') as fin:
+        return loads(fin.read())
+
+
+def json_to_binary(src, dst):
+    """Convert a narrative saved as JSON into a binary file."""
+    with open(src, 'r', encoding='utf8') as fin:
+        dump(json.load(fin), dst)
+
+
+def binary_to_json(src, dst, **kwargs):
+    """Convert a binary narrative file into JSON. `kwargs` are passed to `json.dump`."""
+    with open(dst, 'w', encoding='utf8') as fout:
+        json.dump(load(src).to_dict(doc=True), fout, **kwargs)
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Caching tools.
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+_MISSING = object()
+
+
+class LRUCache(object):
+    """A bounded, thread-safe mapping which evicts the least recently used entries.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of entries held in the cache.
+    ttl : float, optional
+        Number of seconds after which an entry expires. If None (default), entries
+        expire only when evicted. Use `set` to give an entry a different TTL. Expired
+        entries are removed when they are read, when other entries are set (at most once
+        a second), and by `sweep`.
+    maxbytes : int, optional
+        Memory budget of the cache. Least recently used entries are evicted while the
+        total size of entries exceeds it. Requires `sizeof`.
+    sizeof : callable, optional
+        Function which returns the size of a value, in bytes.
+
+    Example
+    -------
+    >>> cache = LRUCache(maxsize=2)
+    >>> cache['a'], cache['b'], cache['c'] = 1, 2, 3
+    >>> 'a' in cache
+    False
+    >>> cache.stats()
+    {'size': 2, 'maxsize': 2, 'nbytes': 0, 'maxbytes': None, 'hits': 0, 'misses': 0,
+     'evictions': 1, 'expirations': 0}
+    """
+
+    def __init__(self, maxsize=128, ttl=None, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self._next_sweep = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            _, _, size = self._data.pop(key)
+            self.nbytes -= size
+
+    def set(self, key, value, ttl=None):
+        """Cache `value` against `key`.
+
+        Parameters
+        ----------
+        key : hashable
+        value : any
+        ttl : float, optional
+            Number of seconds after which this entry expires. Defaults to `self.ttl`.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data[key][2]
+            expiry = None if ttl is None else time.time() + ttl
+            self._data[key] = value, expiry, size
+            self._data.move_to_end(key)
+            self.nbytes += size
+            evicted = self._shrink()
+        for item in evicted:
+            self.on_evict(*item)
+
+    def sweep(self):
+        """Remove all expired entries."""
+        with self._lock:
+            self._next_sweep = 0
+            evicted = self._shrink()
+        for item in evicted:
+            self.on_evict(*item)
+
+    def _sweep(self):
+        now = time.time()
+        if now < self._next_sweep:
+            return []
+        self._next_sweep = now + min(self.ttl or 1, 1)
+        expired = [(key, value) for key, (value, expiry, _) in self._data.items()
+                   if expiry is not None and expiry < now]
+        for key, _ in expired:
+            self.nbytes -= self._data.pop(key)[2]
+        self.expirations += len(expired)
+        return expired
+
+    def _shrink(self):
+        # Remove expired entries, and the least recently used entries while over budget.
+        # Call with the lock held, and call on_evict with the removed entries after
+        # releasing it.
+        evicted = self._sweep()
+        while self._data and (len(self._data) > self.maxsize or (
+                self.maxbytes is not None and self.nbytes > self.maxbytes)):
+            key, (value, _, size) = self._data.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+            evicted.append((key, value))
+        self._removed(evicted)
+        return evicted
+
+    def _removed(self, items):
+        # Called with the lock held, with the (key, value) pairs about to be evicted
+        pass
+
+    def get(self, key, default=None, count=True):
+        """Get the value for `key` if it is cached and hasn't expired, else `default`."""
+        with self._lock:
+            value, expiry, size = self._data.get(key, (_MISSING, None, 0))
+            expired = value is not _MISSING and expiry is not None and expiry < time.time()
+            if expired:
+                del self._data[key]
+                self.nbytes -= size
+                self.expirations += 1
+                self._removed([(key, value)])
+            elif value is not _MISSING:
+                self._data.move_to_end(key)
+                self.hits += count
+                return value
+            self.misses += count
+        if expired:
+            self.on_evict(key, value)
+        return default
+
+    def pop(self, key, default=None):
+        with self._lock:
+            value, _, size = self._data.pop(key, (default, None, 0))
+            self.nbytes -= size
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def items(self):
+        """Get a list of all keys and values, including expired ones."""
+        with self._lock:
+            return [(key, value) for key, (value, _, _) in self._data.items()]
+
+    def on_evict(self, key, value):
+        """Called with every entry that is evicted or expires. Does nothing by default.
+
+        It is called after the entry is removed, without holding the cache's lock.
+        """
+        pass
+
+    def stats(self):
+        """Get the size of the cache and counts of hits, misses, evictions and expirations."""
+        return {
+            'size': len(self), 'maxsize': self.maxsize, 'nbytes': self.nbytes,
+            'maxbytes': self.maxbytes, 'hits': self.hits, 'misses': self.misses,
+            'evictions': self.evictions, 'expirations': self.expirations
+        }
+
+
+class SpillCache(LRUCache):
+    """An `LRUCache` which saves evicted and expired entries to disk.
+
+    Entries that were spilled are loaded again, and deleted from disk, when they are
+    next accessed. Entries that expire while nobody reads them are spilled by a sweep
+    (see `nlg.cache.LRUCache.sweep`). Reading an entry after it expires renews it
+    instead. Setting, popping or deleting a key deletes its file. Disk IO is done without
+    holding the lock of the in-memory cache, so that hits are never blocked by it.
+
+    Parameters
+    ----------
+    path : callable
+        Function which returns the file path to spill the value of a key to.
+    dump : callable
+        Function called as `dump(value, path)` to save a value.
+    load : callable
+        Function called as `load(path)` to load a saved value.
+    **kwargs : dict
+        Arguments passed to `nlg.cache.LRUCache`.
+    """
+
+    def __init__(self, path, dump, load, **kwargs):
+        super(SpillCache, self).__init__(**kwargs)
+        self.path = path
+        self.dump = dump
+        self.load = load
+        # Evicted entries which are not yet on disk, by key
+        self._pending = {}
+        # Serializes reading and writing files
+        self._io_lock = threading.RLock()
+        self.spills = self.reloads = 0
+
+    def __contains__(self, key):
+        if super(SpillCache, self).get(key, _MISSING, count=False) is not _MISSING:
+            return True
+        with self._lock:
+            if key in self._pending:
+                return True
+        return os.path.exists(self.path(key))
+
+    def _removed(self, items):
+        self._pending.update(items)
+
+    def _take_pending(self, key):
+        with self._lock:
+            return self._pending.pop(key, _MISSING)
+
+    def _unlink(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def on_evict(self, key, value):
+        with self._io_lock:
+            with self._lock:
+                # Skip entries which were set, popped or loaded again since their eviction
+                if self._pending.get(key, _MISSING) is not value:
+                    return
+            path = self.path(key)
+            folder = os.path.dirname(path)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            self.dump(value, path)
+            self.spills += 1
+            with self._lock:
+                if self._pending.get(key, _MISSING) is value:
+                    del self._pending[key]
+
+    def set(self, key, value, ttl=None):
+        with self._io_lock:
+            self._take_pending(key)
+            self._unlink(key)
+            super(SpillCache, self).set(key, value, ttl)
+
+    def get(self, key, default=None, count=True):
+        with self._lock:
+            value, expiry, size = self._data.get(key, (_MISSING, None, 0))
+            if expiry is not None and expiry < time.time():
+                # Entries expire so that idle ones are saved to disk. This one is in use,
+                # so it stays in memory for another TTL, instead of being saved and loaded.
+                expiry = None if self.ttl is None else time.time() + self.ttl
+                self._data[key] = value, expiry, size
+        value = super(SpillCache, self).get(key, _MISSING, count)
+        if value is not _MISSING:
+            return value
+        with self._io_lock:
+            # Another thread may have loaded the entry while this one waited
+            value = super(SpillCache, self).get(key, _MISSING, count=False)
+            if value is not _MISSING:
+                return value
+            value = self._take_pending(key)
+            if value is _MISSING:
+                path = self.path(key)
+                if not os.path.isfile(path):
+                    return default
+                value = self.load(path)
+                os.remove(path)
+                self.reloads += 1
+            super(SpillCache, self).set(key, value)
+            return value
+
+    def pop(self, key, default=None):
+        with self._io_lock:
+            value = super(SpillCache, self).pop(key, _MISSING)
+            if value is _MISSING:
+                value = self._take_pending(key)
+            path = self.path(key)
+            if value is _MISSING and os.path.isfile(path):
+                value = self.load(path)
+            self._unlink(key)
+            return default if value is _MISSING else value
+
+    def __delitem__(self, key):
+        if self.pop(key, _MISSING) is _MISSING:
+            raise KeyError(key)
+
+    def stats(self):
+        stats = super(SpillCache, self).stats()
+        stats.update(spills=self.spills, reloads=self.reloads)
+        return stats
+
+
+class FrameFingerprint(object):
+    """Content hashes of a dataframe, computed lazily and memoized for each column.
+
+    Use a new instance whenever the dataframe may have changed.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self._hashes = {}
+
+    def _hash(self, name, obj):
+        if name not in self._hashes:
+            try:
+                values = pd.util.hash_pandas_object(obj, index=False).to_numpy()
+                digest = hashlib.sha1(values.tobytes()).hexdigest()
+            except TypeError:   # Unhashable values, like lists in cells
+                digest = None
+            self._hashes[name] = digest
+        return self._hashes[name]
+
+    def digest(self, columns=None):
+        """Get a hash of the index and some columns of the dataframe.
+
+        Parameters
+        ----------
+        columns : iterable, optional
+            Columns to hash. All columns are hashed by default, along with their order.
+
+        Returns
+        -------
+        str or None
+            Hex digest, or None if the dataframe cannot be hashed.
+        """
+        df = self.df
+        names = list(df.columns)
+        # Columns are hashed by position, since names may be duplicated
+        if columns is None:
+            positions = range(len(names))
+        else:
+            columns = set(columns)
+            positions = sorted((i for i, c in enumerate(names) if c in columns),
+                               key=lambda i: (names[i], i))
+        parts = [repr(df.shape), self._hash(('index',), df.index)]
+        for i in positions:
+            series = df.iloc[:, i]
+            parts.extend([repr(names[i]), str(series.dtype), self._hash(i, series)])
+        if None in parts:
+            return None
+        return hashlib.sha1('\x00'.join(parts).encode('utf8')).hexdigest()
+
+
+def make_key(*parts):
+    """Make a cache key from JSON-serializable parts. Returns None if they aren't."""
+    try:
+        s = json.dumps(parts, sort_keys=True, separators=(',', ':'))
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha1(s.encode('utf8')).hexdigest()
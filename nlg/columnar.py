@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Columnar storage of datasets, for loading them without parsing.
+
+A dataset is stored as a directory with one `.npy` file per column, and a `meta.json`
+holding the names and dtypes of the columns, and the size and modification time of the
+source file it was converted from. Columns with fixed-width dtypes are memory-mapped
+when loaded, so processes loading the same dataset share pages through the OS cache.
+Other columns, like strings, are stored as JSON lists in `.json` files. Values that JSON
+can't represent are stored as strings. Nothing is pickled, since the files are writable
+by users.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+VERSION = 2
+
+
+def _signature(src):
+    stat = os.stat(src)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def save(df, path, src=None):
+    """Save a dataframe in the columnar format.
+
+    The directory is written under a temporary name and renamed when complete, so
+    readers never see a partial dataset.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+    path : str
+        Directory to save the dataset in. It is replaced if it exists.
+    src : str, optional
+        Path to the file that `df` was read from. See `nlg.columnar.is_fresh`.
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    tmpdir = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        meta = {'version': VERSION, 'columns': [], 'dtypes': [], 'json': [],
+                'length': len(df), 'source': _signature(src) if src else None}
+        for i, col in enumerate(df.columns):
+            values = df[col].to_numpy()
+            is_json = values.dtype.hasobject
+            if is_json:
+                with open(os.path.join(tmpdir, f'{i}.json'), 'w', encoding='utf8') as fout:
+                    json.dump(values.tolist(), fout, default=str, separators=(',', ':'))
+            else:
+                np.save(os.path.join(tmpdir, f'{i}.npy'), values, allow_pickle=False)
+            meta['columns'].append(col)
+            meta['dtypes'].append(str(df[col].dtype))
+            meta['json'].append(is_json)
+        with open(os.path.join(tmpdir, 'meta.json'), 'w', encoding='utf8') as fout:
+            json.dump(meta, fout)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.replace(tmpdir, path)
+    except BaseException:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+
+
+def _read_meta(path):
+    with open(os.path.join(path, 'meta.json'), 'r', encoding='utf8') as fin:
+        return json.load(fin)
+
+
+def is_fresh(path, src):
+    """Whether `path` holds a columnar copy of the current version of the file `src`."""
+    try:
+        meta = _read_meta(path)
+    except (OSError, ValueError):
+        return False
+    return meta.get('version') == VERSION and meta.get('source') == _signature(src)
+
+
+def load(path, columns=None, mmap=True):
+    """Load a dataframe saved with `nlg.columnar.save`.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the dataset.
+    columns : iterable, optional
+        If specified, load only these columns.
+    mmap : bool, optional
+        Whether to memory-map columns with fixed-width dtypes. These columns are
+        read-only.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    meta = _read_meta(path)
+    if meta.get('version') != VERSION:
+        raise ValueError(f'Unsupported columnar dataset version: {meta.get("version")}')
+    data = {}
+    index = pd.RangeIndex(meta['length'])
+    for i, col in enumerate(meta['columns']):
+        if columns is not None and col not in columns:
+            continue
+        if meta['json'][i]:
+            with open(os.path.join(path, f'{i}.json'), 'r', encoding='utf8') as fin:
+                items = json.load(fin)
+            values = np.empty(len(items), dtype=object)
+            values[:] = items
+        else:
+            values = np.load(os.path.join(path, f'{i}.npy'), mmap_mode='r' if mmap else None,
+                             allow_pickle=False)
+        if str(values.dtype) != meta['dtypes'][i]:
+            # Extension dtypes, like categories, are saved as objects
+            values = pd.Series(values, index=index).astype(meta['dtypes'][i])
+        data[col] = values
+    return pd.DataFrame(data, index=index, copy=False)
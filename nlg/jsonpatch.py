@@ -0,0 +1,103 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Differences between JSON documents, as JSON patches (RFC 6902).
+
+Only the ``add``, ``remove`` and ``replace`` operations are generated and applied.
+"""
+
+
+def _pointer(path, key):
+    return path + '/' + str(key).replace('~', '~0').replace('/', '~1')
+
+
+def _same(x, y):
+    # 1 == True and 1 == 1.0 in Python, but not in JSON
+    return type(x) is type(y) and x == y
+
+
+def _diff_list(src, dst, path):
+    n = min(len(src), len(dst))
+    # Skip the items at the start and end that are unchanged, so that inserting or
+    # deleting an item doesn't replace all the items after it
+    start = 0
+    while start < n and _same(src[start], dst[start]):
+        start += 1
+    end = 0
+    while end < n - start and _same(src[-1 - end], dst[-1 - end]):
+        end += 1
+    src, dst = src[start:len(src) - end], dst[start:len(dst) - end]
+    ops = []
+    for i in range(min(len(src), len(dst))):
+        ops.extend(diff(src[i], dst[i], _pointer(path, start + i)))
+    for i in range(len(src), len(dst)):
+        ops.append({'op': 'add', 'path': _pointer(path, start + i), 'value': dst[i]})
+    for i in reversed(range(len(dst), len(src))):
+        ops.append({'op': 'remove', 'path': _pointer(path, start + i)})
+    return ops
+
+
+def diff(src, dst, path=''):
+    """Get the JSON patch that turns `src` into `dst`.
+
+    Parameters
+    ----------
+    src, dst : JSON-compatible objects
+        Lists and dicts are compared item by item. Tuples are not supported.
+    path : str, optional
+        JSON pointer to prefix to the paths of the patch.
+
+    Returns
+    -------
+    list
+        Operations of the patch.
+
+    Example
+    -------
+    >>> diff({'a': [1, 2, 3]}, {'a': [1, 3], 'b': 4})
+    [{'op': 'remove', 'path': '/a/1'}, {'op': 'add', 'path': '/b', 'value': 4}]
+    """
+    if isinstance(src, dict) and isinstance(dst, dict):
+        ops = [{'op': 'remove', 'path': _pointer(path, key)} for key in src if key not in dst]
+        for key, value in dst.items():
+            if key in src:
+                ops.extend(diff(src[key], value, _pointer(path, key)))
+            else:
+                ops.append({'op': 'add', 'path': _pointer(path, key), 'value': value})
+        return ops
+    if isinstance(src, list) and isinstance(dst, list):
+        return _diff_list(src, dst, path)
+    if _same(src, dst):
+        return []
+    return [{'op': 'replace', 'path': path, 'value': dst}]
+
+
+def apply(doc, patch):
+    """Apply a JSON patch made by `nlg.jsonpatch.diff` to a document.
+
+    The document is modified in place, except when the whole of it is replaced.
+    Returns the patched document.
+    """
+    for op in patch:
+        if not op['path']:
+            doc = op['value']
+            continue
+        keys = [k.replace('~1', '/').replace('~0', '~') for k in op['path'].split('/')[1:]]
+        parent = doc
+        for key in keys[:-1]:
+            parent = parent[int(key) if isinstance(parent, list) else key]
+        key = keys[-1]
+        if isinstance(parent, list):
+            key = len(parent) if key == '-' else int(key)
+            if op['op'] == 'add':
+                parent.insert(key, op['value'])
+                continue
+        if op['op'] == 'remove':
+            del parent[key]
+        elif op['op'] in ('add', 'replace'):
+            parent[key] = op['value']
+        else:
+            raise ValueError(f'Unsupported JSON patch operation: {op["op"]}')
+    return doc
@@ -3,17 +3,29 @@
 # vim:fenc=utf-8
 
 """The Narrative class."""
+import ast
+import base64
+from collections.abc import MutableMapping
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
 import json
 import re
+import sys
 import warnings
 
+import pandas as pd
 from spacy.tokens import Token, Span, Doc
+from tornado.escape import xhtml_escape
 from tornado.template import Template
 
 from nlg import utils, grammar
+from nlg.cache import LRUCache, FrameFingerprint, make_key
+from nlg.nlpservice import doc_strings
 
 t_templatize = lambda x: '{{ ' + x + ' }}'  # noqa: E731
 nlp = utils.load_spacy_model()
+RENDER_CACHE = LRUCache(maxsize=1024, ttl=600)
+_EXECUTORS = {}
 
 
 def _templatizer_factory(bold, italic, underline):
@@ -29,12 +41,432 @@ def _templatizer_factory(bold, italic, underline):
     return templatizer
 
 
-def _check_unique_token(t, doc):
-    if len([c for c in doc if c.text == t]) > 1:
-        msg = f'There is more than one token in the document that matches the text "{t}".' \
-            + " Using the first match." \
-            + " Please use a `spacy.token.Token` instance for searching."
-        warnings.warn(msg)
+_DF_NAMES = ('df', 'orgdf')
+_VECTORIZABLE_FH_ARGS = {'_sort'}
+
+
+def _literal(node):
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return None
+
+
+def _subscript_value(node):
+    """Get the index node of a subscript (`ast.Index` wraps it in Python < 3.9)."""
+    index = node.slice
+    if isinstance(index, getattr(ast, 'Index', ())):
+        index = index.value
+    return index
+
+
+def _row_access(node):
+    """If `node` is like `df["col"].iloc[0]` or `df["col"].iloc[-1]`, return "col"."""
+    if not (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Attribute)):
+        return None
+    if node.value.attr != 'iloc' or _literal(_subscript_value(node)) not in (0, -1):
+        return None
+    column = node.value.value
+    if not (isinstance(column, ast.Subscript) and isinstance(column.value, ast.Name)):
+        return None
+    if column.value.id not in _DF_NAMES:
+        return None
+    colname = _literal(_subscript_value(column))
+    if isinstance(colname, str):
+        return colname
+
+
+class _RowAccessTransformer(ast.NodeTransformer):
+    """Replace single-row cell lookups in an expression with plain names.
+
+    On a dataframe with a single row, `df["col"].iloc[0]` and `df["col"].iloc[-1]`
+    are both the value of "col" in that row. Replacing them with names lets the
+    expression be evaluated once per row from column arrays, without building a frame.
+    """
+
+    def __init__(self):
+        self.columns = []
+
+    def visit_Subscript(self, node):  # noqa: N802
+        colname = _row_access(node)
+        if colname is None:
+            return self.generic_visit(node)
+        if colname not in self.columns:
+            self.columns.append(colname)
+        return ast.copy_location(
+            ast.Name(id=f'_col{self.columns.index(colname)}', ctx=ast.Load()), node)
+
+
+def _vectorize_expr(expr):
+    """Compile a template expression for row-wise evaluation.
+
+    Parameters
+    ----------
+    expr : str
+        A Python expression from a nugget template.
+
+    Returns
+    -------
+    tuple or None
+        (code, columns, is_column) where `code` is the compiled expression in which
+        every single-row cell lookup is replaced by the names `_col0, _col1, ...`
+        referring to `columns`, and `is_column` is whether the expression is just a
+        single cell lookup. None if the expression depends on the dataframe in
+        any other way (except through `df.columns`), and must be evaluated on each row.
+    """
+    try:
+        tree = ast.parse(expr.strip(), mode='eval')
+    except SyntaxError:
+        return None
+    transformer = _RowAccessTransformer()
+    tree = ast.fix_missing_locations(transformer.visit(tree))
+    allowed = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute) and node.attr == 'columns' \
+                and isinstance(node.value, ast.Name):
+            allowed.add(id(node.value))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in _DF_NAMES and id(node) not in allowed:
+            return None
+    is_column = isinstance(tree.body, ast.Name) and bool(transformer.columns)
+    return compile(tree, '<nugget>', 'eval'), transformer.columns, is_column
+
+
+def _expr_columns(expr):
+    """Find the columns of the dataframe that a template expression depends on.
+
+    Parameters
+    ----------
+    expr : str
+        A Python expression from a nugget template.
+
+    Returns
+    -------
+    set or None
+        Names of columns looked up like `df["col"]` or `df[["col1", "col2"]]`.
+        None if the expression uses the dataframe in any other way which depends on
+        its columns, like `df.columns[0]` or `df.iloc[0, 1]`.
+    """
+    try:
+        tree = ast.parse(expr.strip(), mode='eval')
+    except SyntaxError:
+        return None
+    parents = {}
+    for node in ast.walk(tree):
+        for child in ast.iter_child_nodes(node):
+            parents[id(child)] = node
+    columns = set()
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Name) and node.id in _DF_NAMES):
+            continue
+        parent = parents.get(id(node))
+        if isinstance(parent, ast.Subscript) and parent.value is node:
+            colnames = _literal(_subscript_value(parent))
+            if isinstance(colnames, str):
+                colnames = [colnames]
+            if not isinstance(colnames, (list, tuple)):
+                return None
+            if not all(isinstance(c, str) for c in colnames):
+                return None
+            columns.update(colnames)
+        elif isinstance(parent, ast.Attribute) and parent.attr == 'index':
+            continue
+        elif isinstance(parent, ast.Call) and getattr(parent.func, 'id', '') == 'len':
+            continue
+        else:
+            return None
+    return columns
+
+
+def _fh_args_columns(fh_args):
+    """Find the columns of the dataframe that FormHandler arguments depend on.
+
+    Returns None if the arguments may depend on every column.
+    """
+    columns = set()
+    if '_by' in fh_args and not fh_args.get('_c'):
+        return None     # Aggregates all numeric columns
+    for key, values in fh_args.items():
+        if key in ('_by', '_c', '_sort'):
+            for value in values:
+                if key == '_c' and value.startswith('-'):
+                    return None
+                if key == '_sort':
+                    value = value.lstrip('-')
+                columns.add(value)
+                columns.add(value.rsplit(utils._agg_sep, 1)[0])
+        elif not key.startswith('_'):
+            columns.add(key)
+            columns.add(re.sub(r'(!~|>~|<~|!|>|<|~)$', '', key))
+    return columns
+
+
+@lru_cache(maxsize=1024)
+def _compile_sentence(sent):
+    """Split a sentence template into literal text and `{{ expression }}` chunks.
+
+    Literal chunks are strings, and expression chunks are tuples of the expression
+    and its row-wise compiled form (see `_vectorize_expr`).
+    Returns None if the template contains any other Tornado directives.
+    """
+    chunks = []
+    for i, chunk in enumerate(re.split(r'\{\{(.*?)\}\}', sent, flags=re.DOTALL)):
+        if i % 2:
+            chunks.append((chunk.strip(), _vectorize_expr(chunk)))
+        elif re.search(r'\{[{%#]', chunk):
+            return None
+        else:
+            chunks.append(re.sub(r'\s+', ' ', chunk))
+    return chunks
+
+
+def _model_signature():
+    """Name and version of the spaCy model, against which serialized docs are versioned."""
+    meta = nlp.meta
+    return {'model': f"{meta['lang']}_{meta['name']}", 'version': meta['version']}
+
+
+def _dump_doc(doc):
+    """Serialize a spaCy doc into a JSON-compatible dict.
+
+    Tensors and user data are left out, since they aren't needed to look up tokens. The
+    strings of the doc are stored too, so that a vocabulary without them, like that of
+    `nlg.nlpservice.NLPClient`, can read the doc.
+    """
+    payload = _model_signature()
+    payload['bytes'] = base64.b64encode(doc.to_bytes(exclude=['tensor', 'user_data']))
+    payload['bytes'] = payload['bytes'].decode('ascii')
+    payload['strings'] = doc_strings(doc)
+    return payload
+
+
+def _load_doc(text, payload=None):
+    """Load a spaCy doc serialized with `_dump_doc`, or parse `text` if that isn't possible.
+
+    The serialized doc is used only if it was made with the same model and version as
+    the one currently loaded, and has the same text.
+    """
+    if payload:
+        signature = {k: payload.get(k) for k in ('model', 'version')}
+        if signature == _model_signature():
+            try:
+                for string in payload.get('strings', []):
+                    nlp.vocab.strings.add(string)
+                doc = Doc(nlp.vocab).from_bytes(base64.b64decode(payload['bytes']))
+            except Exception as exc:
+                warnings.warn(f'Cannot load serialized doc, parsing text instead: {exc}')
+            else:
+                if doc.text == text:
+                    return doc
+    return nlp(text)
+
+
+class _SerialExecutor(Executor):
+    """Executor which runs each call immediately, in the calling thread."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+        return future
+
+
+_SERIAL = _SerialExecutor()
+
+
+def get_executor(executor):
+    """Get an executor to render nuggets with.
+
+    Parameters
+    ----------
+    executor : str or concurrent.futures.Executor
+        `"thread"` for a shared thread pool, `"process"` for a shared process pool, or an
+        executor instance, which is returned as is.
+
+    Returns
+    -------
+    concurrent.futures.Executor
+    """
+    if isinstance(executor, Executor):
+        return executor
+    if executor not in _EXECUTORS:
+        if executor == 'thread':
+            _EXECUTORS[executor] = ThreadPoolExecutor(thread_name_prefix='nlg-render')
+        elif executor == 'process':
+            _EXECUTORS[executor] = ProcessPoolExecutor()
+        else:
+            raise ValueError(f'Unknown executor: {executor!r}')
+    return _EXECUTORS[executor]
+
+
+def _generate(template, df, kwargs):
+    """Render a nugget template. Module-level, so it can run in a process pool."""
+    return Template(template, whitespace='oneline').generate(
+        df=df, orgdf=df, U=utils, G=grammar, **kwargs)
+
+
+@lru_cache(maxsize=1024)
+def _compile_expr(expr):
+    return compile(expr, '<nugget>', 'eval')
+
+
+# Names which the preamble of a nugget template sets. See `nlg.narrative.Nugget.add_fh_args`.
+_FILTERED_NAMES = frozenset(['df', 'fh_args'])
+
+
+@lru_cache(maxsize=1024)
+def _expr_names(expr):
+    """Names used in an expression, or None if it can't be parsed."""
+    try:
+        tree = ast.parse(expr.strip(), mode='eval')
+    except SyntaxError:
+        return None
+    return frozenset(node.id for node in ast.walk(tree) if isinstance(node, ast.Name))
+
+
+def _uses_filtered(expr):
+    """Whether an expression may need the filtered dataframe or sanitized fh_args."""
+    names = _expr_names(expr)
+    return names is None or not names.isdisjoint(_FILTERED_NAMES)
+
+
+class _Scope(dict):
+    """Names available to a nugget template with FormHandler arguments `fh_args`.
+
+    The dataframe is filtered by `fh_args` only when an expression which needs `df` or
+    `fh_args` is evaluated with `nlg.narrative._memo_eval`.
+    """
+
+    __slots__ = ('_fh_args',)
+
+    def __init__(self, df, fh_args, kwargs):
+        super(_Scope, self).__init__(U=utils, G=grammar, **kwargs)
+        self['orgdf'] = self['df'] = df
+        self['fh_args'] = {}
+        self._fh_args = fh_args or None
+
+    def resolve(self, expr):
+        if self._fh_args is not None and _uses_filtered(expr):
+            fh_args, self._fh_args = self._fh_args, None
+            self['df'] = utils.gfilter(self['orgdf'], fh_args.copy())
+            self['fh_args'] = utils.sanitize_fh_args(fh_args, self['orgdf'])
+        return self
+
+
+def _memo_eval(expr, namespace, memo):
+    """Evaluate `expr` in `namespace`, unless its value is in `memo` already."""
+    if expr not in memo:
+        memo[expr] = eval(_compile_expr(expr), namespace.resolve(expr))  # nosec
+    return memo[expr]
+
+
+def _escape(value):
+    return xhtml_escape(value if isinstance(value, str) else str(value))
+
+
+def _escape_series(s):
+    # Escape each value the way template autoescaping does: str() first, then xhtml_escape
+    return s.map(_escape)
+
+
+# Formats of expressions generated by `nlg.search.DFSearch.search`, which sources
+# store as their arguments, and a pattern to parse them back
+_SOURCE_FORMATS = [
+    ('df["{}"].iloc[{}]', re.compile(r'^df\["([^"]*)"\]\.iloc\[(-?\d+)\]$')),
+    ('df.columns[{}]', re.compile(r'^df\.columns\[(-?\d+)\]$')),
+]
+_SOURCE_KEYS = {}
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Source(MutableMapping):
+    """A compact, dict-like record of one source of a variable.
+
+    A source has a `tmpl` (the expression that computes the variable), a `type`, a
+    `location` and whether it is `enabled`. Types and locations are interned. Cell and
+    column lookups like `df["name"].iloc[0]` are stored as the column and row, and the
+    expression is built from them when it is read. Any other keys are stored as is.
+    Keys are iterated in the order they were set, so serializing a source gives the same
+    JSON as the dict it was made from.
+
+    Parameters
+    ----------
+    source : dict, optional
+        Keys and values of the source.
+    """
+
+    __slots__ = ('_keys', 'type', 'location', 'enabled', '_tmpl', '_fmt', '_args', '_extra')
+    _fields = frozenset(['type', 'location', 'enabled'])
+
+    def __init__(self, source=None, **kwargs):
+        self._keys = ()
+        self.type = self.location = self.enabled = None
+        self._tmpl = self._fmt = self._args = self._extra = None
+        self.update(source or {}, **kwargs)
+
+    def _add_key(self, key):
+        if key not in self._keys:
+            keys = self._keys + (key,)
+            self._keys = _SOURCE_KEYS.setdefault(keys, keys)
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        if key == 'tmpl':
+            return self._tmpl if self._fmt is None else self._fmt.format(*self._args)
+        if key in self._fields:
+            return getattr(self, key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key == 'tmpl':
+            self._tmpl, self._fmt, self._args = value, None, None
+            for fmt, pattern in _SOURCE_FORMATS:
+                match = pattern.match(value) if isinstance(value, str) else None
+                if match:
+                    args = tuple(_intern(a) if i < len(match.groups()) - 1 else int(a)
+                                 for i, a in enumerate(match.groups()))
+                    if fmt.format(*args) == value:
+                        self._tmpl, self._fmt, self._args = None, fmt, args
+                    break
+        elif key in self._fields:
+            setattr(self, key, _intern(value))
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+        self._add_key(key)
+
+    def __delitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        if key == 'tmpl':
+            self._tmpl = self._fmt = self._args = None
+        elif key in self._fields:
+            setattr(self, key, None)
+        else:
+            del self._extra[key]
+        self._keys = tuple(k for k in self._keys if k != key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def to_dict(self):
+        return {key: self[key] for key in self._keys}
 
 
 class Variable(object):
@@ -58,11 +490,13 @@ class Variable(object):
        * a *name* used to identify the variable within the template of the nugget
     """
 
+    __slots__ = ('_token', 'sources', 'varname', 'inflections', 'templatizer')
+
     def __init__(self, token, sources=None, varname='', inflections=None):
         self._token = token
         if sources is None:
             sources = []
-        self.sources = sources
+        self.sources = [s if isinstance(s, Source) else Source(s) for s in sources]
         self.varname = varname
         if inflections is None:
             inflections = []
@@ -82,7 +516,7 @@ class Variable(object):
         elif isinstance(token, Doc):
             payload['index'] = 0
             payload['idx'] = 0
-        payload['sources'] = self.sources
+        payload['sources'] = [source.to_dict() for source in self.sources]
         payload['varname'] = self.varname
         payload['inflections'] = self.inflections
         return payload
@@ -120,6 +554,21 @@ class Variable(object):
 
     @property
     def template(self):
+        return self.get_template()
+
+    def get_template(self, templatizer=None):
+        """Get the template of the variable.
+
+        Parameters
+        ----------
+        templatizer : callable, optional
+            Function which wraps the expression of the variable into a template.
+            Defaults to `self.templatizer`.
+
+        Returns
+        -------
+        str
+        """
         tmpl = self.enabled_source
         tmplstr = tmpl['tmpl']
 
@@ -130,7 +579,9 @@ class Variable(object):
         if varname:
             return tmplstr
 
-        return self.templatizer(tmplstr)
+        if templatizer is None:
+            templatizer = self.templatizer
+        return templatizer(tmplstr)
 
     def _add_inflection(self, tmplstr, infl):
         func = infl['func_name']
@@ -145,6 +596,75 @@ class Variable(object):
         return self.template
 
 
+def _span(token):
+    """Start and end positions of a token, span or doc."""
+    if isinstance(token, Token):
+        return token.i, token.i + 1
+    if isinstance(token, Span):
+        return token.start, token.end
+    return 0, len(token)
+
+
+class _TokenMap(dict):
+    """Variables of a nugget keyed by their tokens, indexed by the positions they cover."""
+
+    __slots__ = ('covered',)
+
+    def __init__(self, *args, **kwargs):
+        super(_TokenMap, self).__init__()
+        self.covered = {}
+        self.update(*args, **kwargs)
+
+    def _index(self, token):
+        span = _span(token)
+        for i in range(*span):
+            self.covered[i] = span
+
+    def _unindex(self, token):
+        span = _span(token)
+        for i in range(*span):
+            if self.covered.get(i) == span:
+                del self.covered[i]
+
+    def __setitem__(self, token, variable):
+        if token in self:
+            self._unindex(token)
+        super(_TokenMap, self).__setitem__(token, variable)
+        self._index(token)
+
+    def __delitem__(self, token):
+        super(_TokenMap, self).__delitem__(token)
+        self._unindex(token)
+
+    def pop(self, token, *default):
+        if token in self:
+            self._unindex(token)
+        return super(_TokenMap, self).pop(token, *default)
+
+    def popitem(self):
+        token, variable = super(_TokenMap, self).popitem()
+        self._unindex(token)
+        return token, variable
+
+    def setdefault(self, token, default=None):
+        if token not in self:
+            self[token] = default
+        return self[token]
+
+    def update(self, *args, **kwargs):
+        for token, variable in dict(*args, **kwargs).items():
+            self[token] = variable
+
+    def clear(self):
+        super(_TokenMap, self).clear()
+        self.covered.clear()
+
+    def overlaps(self, token):
+        """Whether `token` overlaps a variable other than the one at exactly `token`."""
+        span = _span(token)
+        return any(self.covered.get(i, span) != span for i in range(*span))
+
+
 class Nugget(object):
     """
     Gramex-NLG Nugget
@@ -156,10 +676,14 @@ class Nugget(object):
     Note: This class is not meant to be instantiated directly. Please use `nlg.templatize`.
     """
 
+    __slots__ = ('doc', 'tokenmap', 'fh_args', '_template', 'condition', 'name', 'templatizer',
+                 '_text_index')
+
     def __init__(self, text, tokenmap=None, inflections=None, fh_args=None,
                  condition=None, template="", name=""):
         self.doc = text
-        self.tokenmap = {}
+        self.tokenmap = _TokenMap()
+        self._text_index = None
         if inflections is None:
             inflections = {}
         if tokenmap is not None:
@@ -178,10 +702,19 @@ class Nugget(object):
         self.name = name
         self.templatizer = t_templatize
 
-    def to_dict(self):
-        """Serialze the nugget to dict."""
+    def to_dict(self, doc=False):
+        """Serialze the nugget to dict.
+
+        Parameters
+        ----------
+        doc : bool, optional
+            If True, include the parsed spaCy doc of the nugget, so that it need not be
+            parsed again when loaded with `nlg.narrative.Nugget.from_json`.
+        """
         payload = {}
         payload['text'] = self.doc.text
+        if doc:
+            payload['doc'] = _dump_doc(self.doc)
         tokenmap = []
         for _, variable in self.tokenmap.items():
             tokenmap.append(variable.to_dict())
@@ -190,6 +723,8 @@ class Nugget(object):
         payload['condition'] = self.condition
         payload['name'] = self.name
         payload['template'] = self.template
+        columns = self.columns
+        payload['columns'] = columns if columns is None else sorted(columns)
         return payload
 
     @classmethod
@@ -197,8 +732,9 @@ class Nugget(object):
         if isinstance(obj, str):
             obj = json.loads(obj)
 
+        obj.pop('columns', None)
         text = obj.pop('text')
-        obj['text'] = nlp(text)
+        obj['text'] = _load_doc(text, obj.pop('doc', None))
 
         tokenlist = obj.pop('tokenmap')
         tokenmap = {}
@@ -220,6 +756,40 @@ class Nugget(object):
     def variables(self):
         return self.tokenmap
 
+    @property
+    def columns(self):
+        """Set of dataframe columns that the nugget depends on.
+
+        This includes columns used in the expressions of the variables, in the condition
+        and in the FormHandler arguments of the nugget. It is None if the nugget may
+        depend on all columns, e.g. through expressions like `df.columns[0]`.
+        """
+        return self._columns()
+
+    def _columns(self, fh_args=None):
+        columns = _fh_args_columns(self.fh_args if fh_args is None else fh_args)
+        exprs = [var.enabled_source['tmpl'] for var in self.tokenmap.values()
+                 if var.enabled_source]
+        if self.condition:
+            exprs.append(self.condition)
+        for expr in exprs:
+            if columns is None:
+                break
+            if expr:
+                used = _expr_columns(expr)
+                columns = None if used is None else columns | used
+        return columns
+
+    def _project(self, df, fh_args=None):
+        """Drop columns of `df` that the nugget doesn't depend on."""
+        columns = self._columns(fh_args)
+        if columns is None:
+            return df
+        keep = [c for c in df.columns if c in columns]
+        if len(keep) == len(df.columns):
+            return df
+        return df[keep]
+
     def get_var(self, t):
         """Get a variable from the nugget.
 
@@ -251,11 +821,17 @@ class Nugget(object):
         elif isinstance(t, Token):
             variable = self.tokenmap.get(t, False)
         elif isinstance(t, str):
-            _check_unique_token(t, self.doc)
-            variable = False
-            for token in self.doc:
-                if token.text == t:
-                    variable = self.tokenmap.get(token, False)
+            if self._text_index is None:
+                self._text_index = {}
+                for token in self.doc:
+                    self._text_index.setdefault(token.text, []).append(token.i)
+            positions = self._text_index.get(t, [])
+            if len(positions) > 1:
+                msg = 'There is more than one token in the document that matches the text ' \
+                    + f'"{t}". Using the first match.' \
+                    + " Please use a `spacy.token.Token` instance for searching."
+                warnings.warn(msg)
+            variable = self.tokenmap.get(self.doc[positions[-1]], False) if positions else False
         else:
             if isinstance(t, int):
                 token = self.doc[t]
@@ -267,40 +843,77 @@ class Nugget(object):
             return variable
         raise KeyError('Variable not found.')
 
-    @property
-    def template(self):
+    def _sentence(self, templatizer=None):
+        if templatizer is None:
+            templatizer = self.templatizer
         sent = self.doc.text
         for tk, tkobj in self.tokenmap.items():
-            tmpl = tkobj.template
+            tmpl = tkobj.get_template(templatizer)
             sent = sent.replace(tk.text, tmpl)
             if tkobj.varname:
                 pattern = re.escape(tmpl)
-                sent = re.sub(pattern, self.templatizer(tkobj.varname), sent)
+                sent = re.sub(pattern, templatizer(tkobj.varname), sent)
                 sent = f'{{% set {tkobj.varname} = {tmpl} %}}\n' + sent
+        return sent
+
+    @property
+    def template(self):
+        return self.get_template()
+
+    def get_template(self, templatizer=None, fh_args=None):
+        """Get the Tornado template of the nugget.
+
+        This does not modify the nugget, so templates with different options can be
+        generated from multiple threads at once.
+
+        Parameters
+        ----------
+        templatizer : callable, optional
+            Function which wraps the expressions of variables into the template.
+            Defaults to `self.templatizer`.
+        fh_args : dict, optional
+            FormHandler arguments to use instead of `self.fh_args`.
+
+        Returns
+        -------
+        str
+        """
+        sent = self._sentence(templatizer)
+        if self.condition and not _uses_filtered(self.condition):
+            # Check the condition before filtering the data, and filter only if needed
+            if self._uses_filtered(sent):
+                sent = self.add_fh_args(sent, fh_args)
+            return f'{{% if {self.condition} %}}\n' + sent + '\n{% end %}'
         if self.condition:
             sent = f'{{% if {self.condition} %}}\n' + sent + '\n{% end %}'
-        return self.add_fh_args(sent)
+        return self.add_fh_args(sent, fh_args)
 
-    def _set_templatizer(self, func):
-        self.templatizer = func
-        for _, variable in self.tokenmap.items():
-            variable.templatizer = self.templatizer
-
-    def _reset_templatizer(self):
-        self._set_templatizer(t_templatize)
+    @staticmethod
+    def _uses_filtered(sent):
+        """Whether any expression in a sentence needs the filtered dataframe."""
+        chunks = _compile_sentence(sent)
+        if chunks is None:
+            return True
+        return any(_uses_filtered(c[0]) for c in chunks if not isinstance(c, str))
 
     def to_html(self, bold=True, italic=False, underline=False, **kwargs):
-        self._set_templatizer(_templatizer_factory(bold, italic, underline))
-        try:
-            s = self.render(**kwargs)
-            return s
-        finally:
-            self._reset_templatizer()
+        """Render the nugget as HTML, with variables formatted as specified.
+
+        Parameters
+        ----------
+        bold, italic, underline : bool, optional
+            Styles applied to each variable in the output.
+        **kwargs : dict
+            Arguments passed to `nlg.narrative.Nugget.render`.
+        """
+        kwargs['templatizer'] = _templatizer_factory(bold, italic, underline)
+        return self.render(**kwargs)
 
     def __repr__(self):
         return self.template
 
-    def render(self, df, fh_args=None, **kwargs):
+    def render(self, df, fh_args=None, cache=None, fingerprint=None, templatizer=None,
+               **kwargs):
         """Render the template for the given set of arguments.
 
         Parameters
@@ -311,6 +924,19 @@ class Nugget(object):
         fh_args : dict
             FormHandler arguments to use to transform the dataframe.
 
+        cache : bool or nlg.cache.LRUCache, optional
+            If True, look up the rendered output in `nlg.narrative.RENDER_CACHE` first, and
+            store it there after rendering. The output is cached against the template, the
+            contents of the columns of `df` which the nugget depends on, and `**kwargs`.
+            A different `nlg.cache.LRUCache` instance may also be passed.
+
+        fingerprint : nlg.cache.FrameFingerprint, optional
+            Fingerprint of `df` used for caching. Pass this to share the hashes of columns
+            between nuggets rendered on the same dataframe.
+
+        templatizer : callable, optional
+            Function which wraps the expressions of variables into the template.
+
         **kwargs : dict
             Arguments passed to the `tornado.template.Template.generate` method.
 
@@ -319,6 +945,11 @@ class Nugget(object):
         str
             Rendered string.
 
+        Notes
+        -----
+        Rendering does not modify the nugget, so a nugget may be rendered from multiple
+        threads at once, with different arguments.
+
         Example
         -------
         >>> from nlg import templatize
@@ -328,18 +959,226 @@ class Nugget(object):
         >>> nugget.render(df.iloc[1:])
         b'Cary Grant is at the top of the list'
         """
-        if fh_args is not None:
-            self.fh_args = fh_args
-        else:
-            fh_args = {}
-        kwargs['fh_args'] = fh_args
-        return Template(
-            self.template, whitespace='oneline').generate(
-                df=df, orgdf=df, U=utils, G=grammar, **kwargs)
-
-    def add_fh_args(self, sent):
-        if self.fh_args:
-            fh_args = json.dumps(self.fh_args)
+        return self.submit(_SERIAL, df, fh_args, cache, fingerprint, templatizer,
+                           **kwargs).result()
+
+    def submit(self, executor, df, fh_args=None, cache=None, fingerprint=None,
+               templatizer=None, **kwargs):
+        """Render the nugget in an executor.
+
+        The template is built and the cache is looked up in the calling thread. Only
+        the template is evaluated in `executor`, so that process pools can be used too.
+
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor
+            The executor to render the template in.
+        df, fh_args, cache, fingerprint, templatizer, **kwargs
+            See `nlg.narrative.Nugget.render`.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Future of the rendered bytes.
+        """
+        template = self.get_template(templatizer, fh_args)
+        kwargs['fh_args'] = {} if fh_args is None else fh_args
+        key = None
+        if cache is True:
+            cache = RENDER_CACHE
+        if cache not in (None, False):
+            key = self._cache_key(template, df, fingerprint, kwargs, fh_args)
+            if key is not None:
+                rendered = cache.get(key)
+                if rendered is not None:
+                    return _SERIAL.submit(lambda: rendered)
+        future = executor.submit(_generate, template, self._project(df, fh_args), kwargs)
+        if key is not None:
+            def store(future):
+                if not future.cancelled() and future.exception() is None:
+                    cache[key] = future.result()
+            future.add_done_callback(store)
+        return future
+
+    def _cache_key(self, template, df, fingerprint=None, kwargs=None, fh_args=None):
+        """Key which identifies the output of rendering `template` on `df` with `kwargs`.
+
+        Returns None if `df` or `kwargs` cannot be hashed.
+        """
+        if fingerprint is None:
+            fingerprint = FrameFingerprint(df)
+        digest = fingerprint.digest(self._columns(fh_args))
+        return digest and make_key(template, digest, kwargs)
+
+    def render_rows(self, df, **kwargs):
+        """Render the nugget separately for every row of a dataframe.
+
+        This is equivalent to rendering the nugget on each single-row slice of `df`,
+        but evaluates the template only once for the whole frame wherever possible.
+        Cell lookups like `df["col"].iloc[0]` are read off the column, expressions
+        which don't depend on the rows (like `df.columns[1]` or `fh_args["_sort"][0]`)
+        are evaluated once, other expressions of cells are evaluated once for each distinct
+        combination of cell values, and the sentences are assembled with vectorized string
+        operations. Any other expression is evaluated on each row.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The dataframe, each row of which is rendered.
+
+        **kwargs : dict
+            Arguments passed to the `tornado.template.Template.generate` method.
+
+        Returns
+        -------
+        pandas.Series
+            Rendered strings, stripped of surrounding whitespace, with the same index as `df`.
+
+        Example
+        -------
+        >>> from nlg import templatize
+        >>> df = pd.read_csv('actors.csv')
+        >>> text = nlp("Humphrey Bogart is an actor.")
+        >>> nugget = templatize(text, {}, df)
+        >>> nugget.render_rows(df.head(2))
+        0    Humphrey Bogart is an actor.
+        1         Cary Grant is an actor.
+        dtype: object
+        """
+        fh_args = kwargs.pop('fh_args', None)
+        if fh_args is None:
+            fh_args = self.fh_args
+        chunks = _compile_sentence(self._sentence())
+        if chunks is None or not set(fh_args) <= _VECTORIZABLE_FH_ARGS:
+            rendered = [self.render(df.iloc[[i]], fh_args, **kwargs).decode('utf8').strip()
+                        for i in range(len(df))]
+            return pd.Series(rendered, index=df.index, dtype=object)
+
+        namespace = {'U': utils, 'G': grammar, **kwargs, 'fh_args': {}}
+        if fh_args:
+            namespace['fh_args'] = utils.sanitize_fh_args(fh_args, df)
+        namespace['df'] = namespace['orgdf'] = df
+
+        result = pd.Series('', index=df.index, dtype=object)
+        if self.condition:
+            mask = self._evaluate_rows(self.condition, _vectorize_expr(self.condition),
+                                       df, namespace)
+            if not isinstance(mask, pd.Series):
+                mask = pd.Series(bool(mask), index=df.index)
+            mask = mask.map(bool).to_numpy(dtype=bool)
+            if not mask.all():
+                result[mask] = self.render_rows(df[mask], fh_args=fh_args,
+                                                **kwargs).to_numpy()
+                return result
+
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                result += chunk
+                continue
+            values = self._evaluate_rows(*chunk, df, namespace)
+            if isinstance(values, pd.Series):
+                result += _escape_series(values)
+            else:
+                result += _escape(values)
+        return result.str.strip()
+
+    def _chunks(self):
+        """Compiled sentence of the nugget. See `nlg.narrative._compile_sentence`."""
+        return _compile_sentence(self._sentence())
+
+    def _evaluate(self, namespace, memo):
+        """Evaluate the condition and each expression of the nugget in `namespace`.
+
+        Values of expressions already present in `memo` are not evaluated again, and new
+        ones are added to it. Returns a dict of expressions and their values, or None if
+        the condition of the nugget is false.
+        """
+        chunks = self._chunks()
+        if chunks is None:
+            return {}
+        exprs = [c[0] for c in chunks if not isinstance(c, str)]
+        if self.condition:
+            exprs.insert(0, self.condition)
+        values = {}
+        for expr in exprs:
+            values[expr] = _memo_eval(expr, namespace, memo)
+            if expr is self.condition and not values.pop(expr):
+                return None
+        return values
+
+    def _variable_values(self, namespace, memo):
+        """Evaluate each variable of the nugget, or return None if the condition is false.
+
+        See `nlg.narrative.Nugget._evaluate`.
+        """
+        if self.condition and not _memo_eval(self.condition, namespace, memo):
+            return None
+        values = {}
+        for i, variable in enumerate(self.tokenmap.values()):
+            # The template of a variable, without a templatizer, is its expression
+            values[i] = _memo_eval(variable.get_template(str), namespace, memo)
+        return values
+
+    def _assemble(self, values, templatizer=t_templatize):
+        """Build the text of the nugget from the values of its expressions.
+
+        Parameters
+        ----------
+        values : dict
+            Values of expressions, as returned by `nlg.narrative.Nugget._evaluate`.
+        templatizer : callable, optional
+            Function which wraps variable expressions in the template.
+        """
+        if values is None:
+            return ''
+        before, after = templatizer('\x00').split(t_templatize('\x00'))
+        text = []
+        for chunk in self._chunks():
+            if isinstance(chunk, str):
+                text.append(chunk)
+            else:
+                text.extend([before, _escape(values[chunk[0]]), after])
+        return ''.join(text).strip()
+
+    def _evaluate_rows(self, expr, vectorized, df, namespace):
+        """Evaluate an expression for every row of `df`.
+
+        Returns a scalar if the expression is the same for all rows, else a series.
+        """
+        if vectorized is None:
+            code = compile(expr.strip(), '<nugget>', 'eval')
+            values = []
+            for i in range(len(df)):
+                row = df.iloc[[i]]
+                values.append(eval(code, dict(namespace, df=row, orgdf=row)))  # nosec
+            return pd.Series(values, index=df.index, dtype=object)
+        code, columns, is_column = vectorized
+        if not columns:
+            return eval(code, namespace)  # nosec
+        arrays = [df[c].to_numpy() for c in columns]
+        if is_column:
+            return pd.Series(arrays[0], index=df.index)
+        # Evaluate the expression once for each distinct combination of cells
+        names = [f'_col{i}' for i in range(len(columns))]
+        scope = dict(namespace)
+        values, memo = [], {}
+        for row in zip(*arrays):
+            try:
+                value = memo[row]
+            except KeyError:
+                scope.update(zip(names, row))
+                value = memo[row] = eval(code, scope)  # nosec
+            except TypeError:   # Unhashable cells
+                scope.update(zip(names, row))
+                value = eval(code, scope)  # nosec
+            values.append(value)
+        return pd.Series(values, index=df.index, dtype=object)
+
+    def add_fh_args(self, sent, fh_args=None):
+        if fh_args is None:
+            fh_args = self.fh_args
+        if fh_args:
+            fh_args = json.dumps(fh_args)
             tmpl = f'{{% set fh_args = {fh_args}  %}}\n'
             tmpl += f'{{% set df = U.gfilter(orgdf, fh_args.copy()) %}}\n'
             tmpl += f'{{% set fh_args = U.sanitize_fh_args(fh_args, orgdf) %}}\n'
@@ -379,48 +1218,367 @@ class Nugget(object):
             token = self.doc[token]
         elif isinstance(token, (list, tuple)):
             token = self.doc.char_span(*token)
-        try:
-            if any([token in c for c in self.tokenmap if isinstance(c, (Span, Doc))]):
-                raise ValueError('Token is already contained in another variable.')
-        except TypeError:
-            pass
+            if token is None:
+                raise ValueError('Characters do not align with token boundaries.')
+        if self.tokenmap.overlaps(token):
+            raise ValueError('Token is already contained in another variable.')
         source = [{'tmpl': expr, 'type': 'user', 'enabled': True}]
         self.tokenmap[token] = Variable(token, sources=source, varname=varname)
 
 
+def _share_fingerprint(kwargs):
+    """Fingerprint the dataframe once for all nuggets of a narrative which render it."""
+    if kwargs.get('cache') not in (None, False) and kwargs.get('fingerprint') is None \
+            and 'df' in kwargs:
+        kwargs['fingerprint'] = FrameFingerprint(kwargs['df'])
+
+
+FORMATS = {
+    'html': dict(style='para', liststyle='html', bold=True),
+    'html-list': dict(style='list', liststyle='html', bold=True),
+    'markdown': dict(style='list', liststyle='markdown', bold=False),
+    'text': None,
+}
+
+
+def _wrap_rendered(rendered, style='para', liststyle='html'):
+    """Join rendered nuggets into a paragraph or a list, yielding one chunk per nugget."""
+    if style == 'para':
+        for i, text in enumerate(rendered):
+            yield ' ' + text if i else text
+    elif style == 'list':
+        if liststyle == 'html':
+            yield '<ul>'
+            for text in rendered:
+                yield f'<li>{text}</li>'
+            yield '</ul>'
+        elif liststyle == 'markdown':
+            for i, text in enumerate(rendered):
+                yield ('\n* ' if i else '* ') + text
+        else:
+            raise ValueError('Unknown liststyle.')
+    else:
+        raise ValueError('Unknown style.')
+
+
 class Narrative(list):
     """A list to hold only Nuggets."""
 
     default_style = dict(style='para', liststyle='html', bold=True, italic=False, underline=False)
+    # Style saved with the narrative. Rendering doesn't change it.
+    html_style = default_style
 
-    def render(self, sep=' ', **kwargs):
-        return sep.join([c.render(**kwargs).decode('utf8') for c in self])
+    def evaluate(self, df, return_stats=False, **kwargs):
+        """Evaluate the expressions of all nuggets, each distinct one only once.
 
-    def to_html(self, style='para', liststyle='html', bold=True, italic=False, underline=False,
-                **kwargs):
-        self.html_style = {
-            'bold': bold, 'italic': italic, 'underline': underline,
-            'style': style, 'liststyle': liststyle
-        }
-        rendered = [c.to_html(bold, italic, underline, **kwargs).decode('utf8') for c in self]
-        if style == 'para':
-            s = ' '.join(rendered)
-        elif style == 'list':
-            if liststyle == "html":
-                l_render = "".join(["<li>{}</li>".format(r) for r in rendered])
-                s = f"<ul>{l_render}</ul>"
-            elif liststyle == 'markdown':
-                s = "\n".join(["* " + r for r in rendered])
+        Nuggets with the same FormHandler arguments share the filtered dataframe, and any
+        expression or condition that occurs in more than one of them is evaluated only
+        once.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The dataframe to render.
+        return_stats : bool, optional
+            If True, also return the number of scopes (distinct FormHandler arguments),
+            the number of expressions and conditions looked up, how many of them were
+            evaluated, and how many evaluations were saved.
+        **kwargs : dict
+            Other names available to the templates.
+
+        Returns
+        -------
+        list
+            For each nugget, a dict mapping its expressions to their values, or None if
+            the condition of the nugget is false. Nuggets whose templates cannot be
+            evaluated expression by expression (like those with `{% set %}` directives)
+            get an empty dict. If `return_stats` is True, a tuple of this list and a dict
+            of stats is returned.
+        """
+        scopes = {}
+        results = []
+        n_exprs = 0
+        for nugget, namespace, memo in self._iter_scopes(df, scopes, kwargs):
+            values = nugget._evaluate(namespace, memo)
+            # Nuggets without chunks are rendered by Tornado, not through the memo
+            if nugget._chunks() is not None:
+                n_exprs += len(values or ()) + bool(nugget.condition)
+            results.append(values)
+        if not return_stats:
+            return results
+        n_evals = sum(len(memo) for _, memo in scopes.values())
+        return results, {'scopes': len(scopes), 'expressions': n_exprs,
+                         'evaluations': n_evals, 'saved': n_exprs - n_evals}
+
+    def _iter_scopes(self, df, scopes, kwargs):
+        """Yield each nugget with its namespace and memo of evaluated expressions.
+
+        Nuggets with the same FormHandler arguments share these, which are stored in
+        `scopes`.
+        """
+        kwargs = dict(kwargs)
+        kwargs.pop('cache', None)
+        kwargs.pop('fingerprint', None)
+        fh_args = kwargs.pop('fh_args', None)
+        for nugget in self:
+            args = nugget.fh_args if fh_args is None else fh_args
+            key = json.dumps(args, sort_keys=True)
+            if key not in scopes:
+                scopes[key] = _Scope(df, args, kwargs), {}
+            yield (nugget,) + scopes[key]
+
+    @property
+    def template_version(self):
+        """Hash of the templates of all nuggets. It changes whenever any template does."""
+        return make_key([nugget.template for nugget in self])
+
+    def render_values(self, df, **kwargs):
+        """Evaluate only the variables of each nugget, instead of rendering text.
+
+        Clients which have the rendered narrative can update it with these values, as
+        long as the `version` matches `nlg.narrative.Narrative.template_version` of the
+        narrative which they rendered.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The dataframe to render.
+        **kwargs : dict
+            Other names available to the templates.
+
+        Returns
+        -------
+        dict
+            `{"version": template_version, "values": {nugget_index: {variable_index: value}}}`,
+            where variables are indexed in the order of `nlg.narrative.Nugget.tokenmap`,
+            and values are strings as they would appear in the rendered text, i.e.
+            HTML-escaped like template expressions.
+            Nuggets whose condition is false have None instead of values.
+        """
+        values = {}
+        scopes = {}
+        for i, (nugget, namespace, memo) in enumerate(self._iter_scopes(df, scopes, kwargs)):
+            nvalues = nugget._variable_values(namespace, memo)
+            if nvalues is not None:
+                nvalues = {k: _escape(v) for k, v in nvalues.items()}
+            values[i] = nvalues
+        return {'version': self.template_version, 'values': values}
+
+    def _render_evaluated(self, df, html_style=None, **kwargs):
+        return self._assemble(self.evaluate(df, **kwargs), df, html_style, **kwargs)
+
+    def _assemble(self, values, df, html_style=None, **kwargs):
+        """Build the text of each nugget from values returned by `self.evaluate`."""
+        templatizer = _templatizer_factory(*html_style) if html_style else t_templatize
+        rendered = []
+        for nugget, nvalues in zip(self, values):
+            if nugget._chunks() is not None:
+                text = nugget._assemble(nvalues, templatizer)
+            elif html_style:
+                text = nugget.to_html(*html_style, df=df, **kwargs).decode('utf8').strip()
             else:
-                raise ValueError('Unknown liststyle.')
-        return s
+                text = nugget.render(df, **kwargs).decode('utf8').strip()
+            rendered.append(text)
+        return rendered
+
+    def render_formats(self, df, formats=('html', 'markdown', 'text'), **kwargs):
+        """Render the narrative in many formats, evaluating its expressions only once.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The dataframe to render.
+        formats : list or dict, optional
+            Names of formats in `nlg.narrative.FORMATS`, or a dict mapping names of formats
+            to their options. Options are the style arguments of
+            `nlg.narrative.Narrative.to_html`, or None for plain text.
+        **kwargs : dict
+            Other names available to the templates.
+
+        Returns
+        -------
+        dict
+            The rendered narrative in each format. As with `cse=True` in
+            `nlg.narrative.Narrative.render`, the output of each nugget is stripped.
+
+        Example
+        -------
+        >>> out = narrative.render_formats(df, ['html', 'text'])
+        >>> out['text'] == narrative.render(df=df, cse=True)
+        True
+        """
+        if not isinstance(formats, dict):
+            formats = {name: FORMATS[name] for name in formats}
+        values = self.evaluate(df, **kwargs)
+        kwargs.pop('cache', None)
+        kwargs.pop('fingerprint', None)
+        result = {}
+        for name, options in formats.items():
+            if options is None:
+                result[name] = ' '.join(self._assemble(values, df, **kwargs))
+                continue
+            options = dict(self.default_style, **options)
+            html_style = tuple(options[k] for k in ('bold', 'italic', 'underline'))
+            rendered = self._assemble(values, df, html_style, **kwargs)
+            result[name] = ''.join(
+                _wrap_rendered(rendered, options['style'], options['liststyle']))
+        return result
+
+    def _iter_nuggets(self, executor=None, timeout=None, **kwargs):
+        _share_fingerprint(kwargs)
+        if executor is None:
+            for nugget in self:
+                yield nugget.render(**kwargs).decode('utf8')
+            return
+        executor = get_executor(executor)
+        futures = [c.submit(executor, **kwargs) for c in self]
+        try:
+            for future in futures:
+                yield future.result(timeout=timeout).decode('utf8')
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def iter_render(self, sep=' ', executor=None, timeout=None, **kwargs):
+        """Render the narrative one nugget at a time.
+
+        Yields the output of each nugget as soon as it is rendered, preceded by `sep`
+        for all but the first. Joining the chunks gives the output of
+        `nlg.narrative.Narrative.render`.
+
+        Parameters
+        ----------
+        sep, executor, timeout, **kwargs
+            See `nlg.narrative.Narrative.render`.
+        """
+        for i, text in enumerate(self._iter_nuggets(executor, timeout, **kwargs)):
+            yield sep + text if i else text
+
+    def render(self, sep=' ', cse=False, executor=None, timeout=None, **kwargs):
+        """Render all nuggets of the narrative.
+
+        Parameters
+        ----------
+        sep : str, optional
+            Separator between rendered nuggets.
+        cse : bool, optional
+            If True, evaluate each distinct expression in the narrative only once (see
+            `nlg.narrative.Narrative.evaluate`). The output of each nugget is then stripped
+            of surrounding whitespace.
+        executor : str or concurrent.futures.Executor, optional
+            If specified, render nuggets concurrently in this executor (see
+            `nlg.narrative.get_executor`). Use `"thread"` for most narratives, and
+            `"process"` for CPU-heavy pandas expressions. Ignored if `cse` is True.
+        timeout : float, optional
+            Number of seconds to wait for each nugget when rendering in an executor.
+            `concurrent.futures.TimeoutError` is raised if a nugget takes longer.
+        **kwargs : dict
+            Arguments passed to `nlg.narrative.Nugget.render`.
+
+        Returns
+        -------
+        str
+            Rendered nuggets, in order, joined by `sep`.
+        """
+        if cse:
+            return sep.join(self._render_evaluated(**kwargs))
+        return ''.join(self.iter_render(sep, executor, timeout, **kwargs))
+
+    def rerender(self, df, sep=' ', **kwargs):
+        """Render the narrative, reusing the output of nuggets whose inputs haven't changed.
+
+        The first call renders every nugget. Subsequent calls render only those nuggets
+        whose template, template arguments or the data in the columns they depend on
+        (see `nlg.narrative.Nugget.columns`) have changed since the last call. The
+        positions of nuggets that were rendered again are stored in `self.rerendered`.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The dataframe to render.
+        sep : str, optional
+            Separator between rendered nuggets.
+        **kwargs : dict
+            Arguments passed to `nlg.narrative.Nugget.render`.
+
+        Returns
+        -------
+        str
+            Rendered narrative, as returned by `nlg.narrative.Narrative.render`.
+        """
+        previous = getattr(self, '_rendered', {})
+        fingerprint = FrameFingerprint(df)
+        rendered, texts, self.rerendered = {}, [], []
+        for i, nugget in enumerate(self):
+            fh_args = kwargs.get('fh_args')
+            key = nugget._cache_key(nugget.get_template(fh_args=fh_args), df, fingerprint,
+                                    kwargs, fh_args)
+            text = previous.get(key) if key is not None else None
+            if text is None:
+                text = nugget.render(df, **kwargs).decode('utf8')
+                self.rerendered.append(i)
+            if key is not None:
+                rendered[key] = text
+            texts.append(text)
+        self._rendered = rendered
+        return sep.join(texts)
+
+    def to_html(self, style='para', liststyle='html', bold=True, italic=False, underline=False,
+                cse=False, executor=None, timeout=None, **kwargs):
+        if cse:
+            rendered = self._render_evaluated(html_style=(bold, italic, underline), **kwargs)
+        else:
+            kwargs['templatizer'] = _templatizer_factory(bold, italic, underline)
+            rendered = self._iter_nuggets(executor, timeout, **kwargs)
+        return ''.join(_wrap_rendered(rendered, style, liststyle))
+
+    def iter_html(self, style='para', liststyle='html', bold=True, italic=False,
+                  underline=False, executor=None, timeout=None, **kwargs):
+        """Render the narrative as HTML one nugget at a time.
+
+        Yields the output of each nugget, along with the list markup around it, as soon
+        as it is rendered. Joining the chunks gives the output of
+        `nlg.narrative.Narrative.to_html`.
+
+        Parameters
+        ----------
+        style, liststyle, bold, italic, underline, executor, timeout, **kwargs
+            See `nlg.narrative.Narrative.to_html`.
+        """
+        kwargs['templatizer'] = _templatizer_factory(bold, italic, underline)
+        rendered = self._iter_nuggets(executor, timeout, **kwargs)
+        yield from _wrap_rendered(rendered, style, liststyle)
 
     def move(self, x, y):
         raise NotImplementedError
 
-    def to_dict(self):
-        return {'narrative': [c.to_dict() for c in self],
-                'style': getattr(self, 'html_style', self.default_style)}
+    @property
+    def columns(self):
+        """Set of dataframe columns that any nugget depends on, or None if unknown.
+
+        See `nlg.narrative.Nugget.columns`.
+        """
+        columns = set()
+        for nugget in self:
+            used = nugget.columns
+            if used is None:
+                return None
+            columns |= used
+        return columns
+
+    def to_dict(self, doc=False):
+        """Serialize the narrative to dict.
+
+        Parameters
+        ----------
+        doc : bool, optional
+            If True, include the parsed spaCy docs of nuggets. See
+            `nlg.narrative.Nugget.to_dict`.
+        """
+        columns = self.columns
+        return {'narrative': [c.to_dict(doc) for c in self],
+                'style': self.html_style,
+                'columns': columns if columns is None else sorted(columns)}
 
     @classmethod
     def from_json(cls, obj):
@@ -0,0 +1,299 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+A local NLP service, so that processes can share one copy of the spaCy model.
+
+Start the service with::
+
+    $ python -m nlg.nlpservice --address 127.0.0.1:9983 --authkey secret --workers 2
+
+and set the ``NLG_NLP_SERVICE`` and ``NLG_NLP_AUTHKEY`` environment variables to the
+same address and key in each gramex process. The key is required, since the service
+exchanges pickles with its clients. If ``--authkey`` isn't given, it is read from
+``NLG_NLP_AUTHKEY``. `nlg.utils.load_spacy_model` then returns
+an `nlg.nlpservice.NLPClient` instead of loading the model. Docs are parsed by the
+service's worker processes, and rebuilt in the client with a blank vocabulary.
+
+The service parses requests which arrive together in batches, with ``nlp.pipe``.
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from multiprocessing.managers import BaseManager
+import os
+import queue
+import threading
+import time
+
+_model = {}
+# Token attributes whose strings the client needs to read a doc
+_STRING_ATTRS = ('text', 'lemma_', 'norm_', 'lower_', 'shape_', 'prefix_', 'suffix_',
+                 'tag_', 'dep_', 'ent_type_', 'ent_id_')
+
+
+def doc_strings(doc):
+    """Get the strings that a vocabulary needs to read the attributes of a doc.
+
+    ``Doc.to_bytes`` stores the hashes of lemmas, tags, etc. These can't be looked up in
+    a vocabulary which hasn't seen the strings.
+    """
+    strings = set()
+    for token in doc:
+        strings.update(getattr(token, attr) for attr in _STRING_ATTRS)
+    strings.discard('')
+    return sorted(strings)
+
+
+def _init_worker(model):
+    from spacy import load
+    _model['nlp'] = load(model)
+
+
+def _parse(texts):
+    return [(doc.to_bytes(exclude=['tensor', 'user_data']), doc_strings(doc))
+            for doc in _model['nlp'].pipe(texts)]
+
+
+def _meta():
+    meta = _model['nlp'].meta
+    return {k: meta[k] for k in ('lang', 'name', 'version')}
+
+
+class Batcher(object):
+    """Parses texts in worker processes, combining concurrent requests into batches.
+
+    A new batch is started only when a worker is free. Requests that arrive while all
+    workers are busy are parsed together in the next batch.
+
+    Parameters
+    ----------
+    model : str, optional
+        Name of the spaCy model to load in each worker.
+    workers : int, optional
+        Number of worker processes.
+    batch_size : int, optional
+        Maximum number of texts in a batch.
+    delay : float, optional
+        Seconds to wait for more requests before starting a batch.
+    timeout : float, optional
+        Seconds that `parse` waits for a result before raising a TimeoutError.
+    """
+
+    def __init__(self, model='en_core_web_sm', workers=1, batch_size=256, delay=0.005,
+                 timeout=60):
+        self.model = model
+        self.workers = workers
+        self.executor = self._new_executor()
+        self.batch_size = batch_size
+        self.delay = delay
+        self.timeout = timeout
+        self._meta = None
+        self._queue = queue.Queue()
+        self._free = threading.BoundedSemaphore(workers)
+        self.requests = self.texts = self.batches = 0
+        self._thread = threading.Thread(target=self._dispatch, name='nlg-nlp-batcher',
+                                        daemon=True)
+        self._thread.start()
+
+    def parse(self, texts):
+        """Parse a list of texts.
+
+        Returns
+        -------
+        list
+            ``(bytes, strings)`` for each text. Use `nlg.nlpservice.NLPClient` to read
+            them as docs.
+        """
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future.result(self.timeout)
+
+    def meta(self):
+        """Get the language, name and version of the model."""
+        if self._meta is None:
+            self._meta = self.executor.submit(_meta).result()
+        return self._meta
+
+    def stats(self):
+        """Get the number of requests, texts and batches parsed so far."""
+        return {'requests': self.requests, 'texts': self.texts, 'batches': self.batches,
+                'queued': self._queue.qsize()}
+
+    def shutdown(self):
+        self._queue.put(None)
+        self._thread.join()
+        self.executor.shutdown()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                   initargs=(self.model, ))
+
+    def _submit(self, texts):
+        try:
+            return self.executor.submit(_parse, texts)
+        except BrokenProcessPool:
+            # A worker died, and the pool accepts no more work. Replace it and retry once.
+            self.executor.shutdown(wait=False)
+            self.executor = self._new_executor()
+            return self.executor.submit(_parse, texts)
+
+    def _dispatch(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._free.acquire()
+            batch, size = [item], len(item[0])
+            deadline = time.time() + self.delay
+            while size < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self.requests += len(batch)
+            self.texts += size
+            self.batches += 1
+            texts = [text for texts, _ in batch for text in texts]
+            try:
+                future = self._submit(texts)
+            except Exception as exc:
+                self._free.release()
+                for _, result in batch:
+                    result.set_exception(exc)
+                continue
+            future.add_done_callback(partial(self._resolve, batch))
+
+    def _resolve(self, batch, future):
+        self._free.release()
+        exc = future.exception()
+        if exc is not None:
+            for _, result in batch:
+                result.set_exception(exc)
+            return
+        results = future.result()
+        for texts, result in batch:
+            result.set_result(results[:len(texts)])
+            results = results[len(texts):]
+
+
+class _ClientManager(BaseManager):
+    pass
+
+
+_ClientManager.register('service')
+
+
+def _parse_address(address):
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+def make_server(address, authkey, **kwargs):
+    """Create a server for the NLP service. `kwargs` are passed to `Batcher`.
+
+    Call ``.serve_forever()`` on the result to start serving. `authkey` must not be
+    empty.
+    """
+    if not authkey:
+        raise ValueError('The NLP service needs an authkey.')
+    batcher = Batcher(**kwargs)
+    manager_class = type('_ServerManager', (BaseManager, ), {})
+    manager_class.register('service', callable=lambda: batcher,
+                           exposed=('parse', 'meta', 'stats'))
+    manager = manager_class(address=address, authkey=authkey)
+    server = manager.get_server()
+    server.batcher = batcher
+    return server
+
+
+class NLPClient(object):
+    """Stands in for a spaCy model, by parsing text with the NLP service.
+
+    It supports calling on a text, ``pipe``, ``vocab`` and ``meta``. All docs it returns
+    share a blank vocabulary of the model's language.
+
+    Parameters
+    ----------
+    address : str or tuple
+        ``host:port`` of the service.
+    authkey : bytes
+        Must be the key that the service was started with.
+    """
+
+    def __init__(self, address, authkey):
+        if not authkey:
+            raise ValueError('The NLP service needs an authkey. Set NLG_NLP_AUTHKEY.')
+        if isinstance(address, str):
+            address = _parse_address(address)
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._meta = self._vocab = None
+
+    def _service(self):
+        # Manager proxies can't be shared across threads. Open one connection per thread.
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            manager = _ClientManager(address=self.address, authkey=self.authkey)
+            manager.connect()
+            service = self._local.service = manager.service()
+        return service
+
+    @property
+    def meta(self):
+        if self._meta is None:
+            self._meta = dict(self._service().meta())
+        return self._meta
+
+    @property
+    def vocab(self):
+        with self._lock:
+            if self._vocab is None:
+                from spacy import blank
+                self._vocab = blank(self.meta['lang']).vocab
+        return self._vocab
+
+    def _to_doc(self, payload):
+        from spacy.tokens import Doc
+        data, strings = payload
+        for s in strings:
+            self.vocab.strings.add(s)
+        return Doc(self.vocab).from_bytes(data)
+
+    def __call__(self, text):
+        return self.pipe([text])[0]
+
+    def pipe(self, texts, **kwargs):
+        """Parse many texts in one request. Returns a list of docs."""
+        return [self._to_doc(payload) for payload in self._service().parse(list(texts))]
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Parse text for NLG processes.')
+    parser.add_argument('--address', default='127.0.0.1:9983', help='host:port to listen on')
+    parser.add_argument('--authkey', default=os.environ.get('NLG_NLP_AUTHKEY', ''),
+                        help='Key that clients must use. Defaults to $NLG_NLP_AUTHKEY')
+    parser.add_argument('--model', default='en_core_web_sm')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--delay', type=float, default=0.005)
+    args = parser.parse_args(args)
+    if not args.authkey:
+        parser.error('--authkey or $NLG_NLP_AUTHKEY is required')
+    server = make_server(_parse_address(args.address), args.authkey.encode('utf8'),
+                         model=args.model, workers=args.workers,
+                         batch_size=args.batch_size, delay=args.delay)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Decoding the dataframes that clients post to the webapp.
+
+The format of a request body is chosen by its content type:
+
+- ``application/vnd.apache.arrow.stream``: an Arrow IPC stream. Other fields of the
+  request, like ``nrid`` or ``text``, are stored as JSON in the ``nlg`` key of the
+  schema's metadata. Needs `pyarrow`.
+- ``application/vnd.nlg.frame``: typed arrays, written by `nlg.payload.dumps`.
+- Anything else is JSON, where ``data`` holds either a list of row records, or an object
+  mapping column names to lists of values.
+
+The typed array format is::
+
+    b'NLGF' | version (uint16) | header length (uint32) | header (JSON) | buffers ...
+
+The header holds the other fields of the request as ``meta``, the number of rows, and
+the name, dtype, offset and length of each column. Columns with fixed-width numpy dtypes
+are stored as raw little-endian arrays, read without copying. Other columns are stored
+as UTF-8 JSON lists.
+"""
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+ARROW_TYPE = 'application/vnd.apache.arrow.stream'
+FRAME_TYPE = 'application/vnd.nlg.frame'
+MAGIC = b'NLGF'
+VERSION = 1
+_HEADER = struct.Struct('<4sHI')
+
+
+def _pad(size, align=8):
+    return -size % align
+
+
+def dumps(df, meta=None):
+    """Serialize a dataframe and other request fields into the typed array format.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+    meta : dict, optional
+        Other fields of the request, like ``nrid`` or ``text``.
+
+    Returns
+    -------
+    bytes
+    """
+    columns, buffers, offset = [], [], 0
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if values.dtype.hasobject:
+            dtype = 'json'
+            buf = json.dumps(values.tolist(), separators=(',', ':')).encode('utf8')
+        else:
+            values = values.astype(values.dtype.newbyteorder('<'), copy=False)
+            dtype = values.dtype.str
+            buf = np.ascontiguousarray(values).tobytes()
+        columns.append({'name': col, 'dtype': dtype, 'offset': offset, 'length': len(buf)})
+        buf += b'\x00' * _pad(len(buf))
+        buffers.append(buf)
+        offset += len(buf)
+    header = {'meta': meta or {}, 'length': len(df), 'columns': columns}
+    header = json.dumps(header, separators=(',', ':')).encode('utf8')
+    header += b' ' * _pad(_HEADER.size + len(header))
+    return b''.join([_HEADER.pack(MAGIC, VERSION, len(header)), header] + buffers)
+
+
+def loads(data):
+    """Read a payload serialized with `nlg.payload.dumps`.
+
+    Returns
+    -------
+    tuple
+        ``(meta, df)``, where ``meta`` is a dict of the other request fields.
+    """
+    try:
+        magic, version, size = _HEADER.unpack_from(data)
+    except struct.error as e:
+        raise ValueError(f'Frame payload is too short: {e}') from e
+    if magic != MAGIC:
+        raise ValueError('Not an NLG frame payload.')
+    if version > VERSION:
+        raise ValueError(f'Unsupported frame payload version: {version}')
+    start = _HEADER.size + size
+    if len(data) < start:
+        raise ValueError('Frame payload is truncated.')
+    header = json.loads(bytes(data[_HEADER.size:start]).decode('utf8'))
+    body = memoryview(data)[start:]
+    frame = {}
+    for col in header['columns']:
+        if col['offset'] + col['length'] > len(body):
+            raise ValueError(f'Frame payload is truncated in column {col["name"]}.')
+        buf = body[col['offset']:col['offset'] + col['length']]
+        if col['dtype'] == 'json':
+            frame[col['name']] = json.loads(bytes(buf).decode('utf8'))
+        else:
+            frame[col['name']] = np.frombuffer(buf, dtype=col['dtype'])
+    df = pd.DataFrame(frame, index=pd.RangeIndex(header['length']),
+                      columns=[col['name'] for col in header['columns']])
+    return header['meta'], df
+
+
+def _read_arrow(data):
+    import pyarrow as pa
+    table = pa.ipc.open_stream(data).read_all()
+    meta = (table.schema.metadata or {}).get(b'nlg', b'{}')
+    return json.loads(meta.decode('utf8')), table.to_pandas()
+
+
+def frame(data):
+    """Make a dataframe from row records, or from a dict of columns."""
+    if isinstance(data, dict):
+        return pd.DataFrame(data)
+    return pd.DataFrame.from_records(data)
+
+
+def read(body, content_type=''):
+    """Read the fields and dataframe from a request body.
+
+    Parameters
+    ----------
+    body : bytes
+    content_type : str, optional
+        Value of the Content-Type header of the request.
+
+    Returns
+    -------
+    tuple
+        ``(meta, df)``, where ``meta`` is a dict of the fields of the request other
+        than the data. ``df`` is None if a JSON body has no data.
+    """
+    mimetype = content_type.split(';', 1)[0].strip().lower()
+    if mimetype == FRAME_TYPE:
+        return loads(body)
+    if mimetype == ARROW_TYPE:
+        return _read_arrow(body)
+    meta = json.loads(body.decode('utf8') if isinstance(body, bytes) else body)
+    data = meta.pop('data', None)
+    return meta, None if data is None else frame(data)
@@ -75,12 +75,13 @@ def _preprocess_array_search(text, array, literal=False, case=False, lemmatize=T
     elif lemmatize:
         tokens = pd.Series([c.lemma_ for c in text], index=text)
         if array.ndim == 1:
-            array = array.map(nlp)
-            array = pd.Series([token.lemma_ for doc in array for token in doc])
+            # Parse all cells together, which needs one request with the NLP service
+            docs = nlp.pipe(array.tolist())
+            array = pd.Series([token.lemma_ for doc in docs for token in doc])
         elif array.ndim == 2:
             for col in array.columns[array.dtypes == np.dtype('O')]:
                 s = [c if isinstance(c, str) else str(c) for c in array[col]]
-                s = [nlp(c) for c in s]
+                s = nlp.pipe(s)
                 try:
                     array[col] = [token.lemma_ for doc in s for token in doc]
                 except ValueError:
@@ -0,0 +1,102 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Tests for the nlg.binary module.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from nlg import binary, templatize
+from nlg.narrative import Narrative, Nugget
+from nlg.utils import load_spacy_model
+
+op = os.path
+nlp = load_spacy_model()
+
+
+class TestBinary(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.df = pd.read_csv(op.join(op.dirname(__file__), "data", "actors.csv"),
+                             encoding='utf8')
+        fh_args = {'_sort': ['-rating']}
+        cls.narrative = Narrative([
+            templatize(nlp('James Stewart is the actor with the highest rating.'),
+                       fh_args, cls.df),
+            templatize(nlp('Katharine Hepburn is the actress with the least rating.'),
+                       fh_args, cls.df),
+            templatize(nlp('Humphrey Bogart is the top rated actor.'), {}, cls.df),
+        ])
+        cls.narrative.html_style = dict(Narrative.default_style, style='list')
+
+    def test_lazy_load(self):
+        narrative = binary.loads(binary.dumps(self.narrative))
+        self.assertIsInstance(narrative, Narrative)
+        self.assertEqual(len(narrative), 3)
+        self.assertEqual(narrative.loaded, 0)
+        self.assertDictEqual(narrative.html_style, self.narrative.html_style)
+        self.assertEqual(narrative.columns, self.narrative.columns)
+        partial = binary.loads(binary.dumps(Narrative(self.narrative[2:])))
+        self.assertSetEqual(partial.columns, self.narrative[2].columns)
+        self.assertEqual(partial.loaded, 0)
+        self.assertEqual(narrative.loaded, 0)
+
+        self.assertEqual(narrative[1].render(self.df), self.narrative[1].render(self.df))
+        self.assertEqual(narrative.loaded, 1)
+        self.assertEqual(narrative.to_html(df=self.df, **narrative.html_style),
+                         self.narrative.to_html(df=self.df, **narrative.html_style))
+        self.assertEqual(narrative.loaded, 3)
+
+        narrative = binary.loads(binary.dumps(self.narrative))
+        nugget = narrative.pop(0)
+        self.assertEqual(nugget.render(self.df), self.narrative[0].render(self.df))
+        self.assertEqual(len(narrative), 2)
+        self.assertEqual(narrative.loaded, 0)
+
+        with self.assertRaises(ValueError):
+            binary.loads(b'{"narrative": []}')
+        data = binary.dumps(self.narrative)
+        for size in (3, 12, len(data) - 1):
+            with self.assertRaises(ValueError):
+                binary.loads(data[:size])
+        corrupt = bytearray(data)
+        corrupt[-8:] = b'\x00' * 8
+        narrative = binary.loads(bytes(corrupt))
+        with self.assertRaises(ValueError):
+            narrative[-1]
+
+    def test_ntokens(self):
+        narrative = binary.loads(binary.dumps(self.narrative))
+        self.assertEqual(narrative.ntokens, sum(len(n.doc) for n in self.narrative))
+        self.assertEqual(narrative.loaded, 0)
+
+    def test_list_methods(self):
+        narrative = binary.loads(binary.dumps(self.narrative))
+        for nuggets in (narrative.copy(), list(reversed(narrative))[::-1]):
+            self.assertEqual([type(n) for n in nuggets], [Nugget] * len(self.narrative))
+            self.assertEqual([n.render(self.df) for n in nuggets],
+                             [n.render(self.df) for n in self.narrative])
+
+    def test_convert(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = op.join(tmpdir, 'narrative.json')
+            with open(src, 'w', encoding='utf8') as fout:
+                json.dump(self.narrative.to_dict(), fout, indent=4)
+            binary.json_to_binary(src, op.join(tmpdir, 'narrative.nlgb'))
+            self.assertLess(op.getsize(op.join(tmpdir, 'narrative.nlgb')), op.getsize(src))
+            binary.binary_to_json(op.join(tmpdir, 'narrative.nlgb'), op.join(tmpdir, 'out.json'))
+            with open(op.join(tmpdir, 'out.json'), encoding='utf8') as fin:
+                narrative = Narrative.from_json(json.load(fin))
+        self.assertEqual(narrative.render(df=self.df), self.narrative.render(df=self.df))
+
+
+if __name__ == "__main__":
+    unittest.main()
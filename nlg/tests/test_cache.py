@@ -0,0 +1,175 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Tests for the nlg.cache module.
+"""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+
+from nlg.cache import LRUCache, SpillCache, FrameFingerprint, make_key
+
+op = os.path
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache['a'], 1)  # makes 'b' the least recently used
+        cache['c'] = 3
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        self.assertEqual(len(cache), 2)
+        with self.assertRaises(KeyError):
+            cache['b']
+        self.assertIsNone(cache.get('b'))
+        self.assertDictEqual(cache.stats(), {
+            'size': 2, 'maxsize': 2, 'nbytes': 0, 'maxbytes': None, 'hits': 1, 'misses': 2,
+            'evictions': 1, 'expirations': 0})
+
+    def test_maxbytes(self):
+        cache = LRUCache(maxbytes=10, sizeof=len)
+        cache['a'] = 'xxxx'
+        cache['b'] = 'xxxx'
+        self.assertEqual(cache.nbytes, 8)
+        cache['b'] = 'xx'
+        self.assertEqual(cache.nbytes, 6)
+        cache['c'] = 'xxxxx'
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.nbytes, 7)
+        self.assertEqual(cache.pop('c'), 'xxxxx')
+        self.assertEqual(cache.nbytes, 2)
+        del cache['b']
+        self.assertEqual(cache.nbytes, 0)
+        cache['d'] = 'x' * 11   # Larger than the budget
+        self.assertNotIn('d', cache)
+        self.assertEqual(cache.nbytes, 0)
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=0.05)
+        cache['a'] = 1
+        self.assertEqual(cache.get('a'), 1)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+        cache.set('b', 2, ttl=10)
+        cache['c'] = 3
+        time.sleep(0.1)
+        self.assertEqual(cache.get('b'), 2)
+        self.assertIsNone(cache.get('c'))
+
+        # Expired entries are removed when others are set, or by sweep, without reading them
+        cache = LRUCache(ttl=0.05, sizeof=len)
+        cache['a'], cache['b'] = 'xx', 'xxx'
+        time.sleep(0.1)
+        cache['c'] = 'x'
+        self.assertEqual((len(cache), cache.nbytes), (1, 1))
+        time.sleep(0.1)
+        cache.sweep()
+        self.assertEqual((len(cache), cache.nbytes), (0, 0))
+        self.assertEqual(cache.stats()['expirations'], 3)
+
+    def test_spill_ttl(self):
+        calls = []
+        cache = SpillCache(path=lambda key: key, dump=lambda v, path: calls.append('dump'),
+                           load=lambda path: calls.append('load'), ttl=0.05)
+        with patch('os.remove'), patch('os.path.isfile', return_value=True):
+            cache['a'], cache['b'] = [1], [2]
+            time.sleep(0.1)
+            # Entries read after they expire are renewed, not saved and loaded again
+            self.assertEqual(cache.get('a'), [1])
+            self.assertEqual(calls, [])
+            # Idle entries are saved by sweeps
+            cache.sweep()
+            self.assertEqual(calls, ['dump'])
+            self.assertIn('a', cache)
+
+    def test_spill(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            def dump(value, path):
+                with open(path, 'w') as fout:
+                    json.dump(value, fout)
+
+            def load(path):
+                with open(path) as fin:
+                    return json.load(fin)
+
+            cache = SpillCache(path=lambda key: op.join(tmpdir, key, 'cache.json'),
+                               dump=dump, load=load, maxsize=1)
+            cache['a'] = [1]
+            cache['b'] = [2]
+            self.assertTrue(op.isfile(op.join(tmpdir, 'a', 'cache.json')))
+            self.assertEqual(cache['a'], [1])
+            self.assertFalse(op.isfile(op.join(tmpdir, 'a', 'cache.json')))
+            self.assertIn('b', cache)
+            self.assertEqual(cache.get('b'), [2])
+            del cache['a']
+            self.assertNotIn('a', cache)
+            self.assertFalse(op.isfile(op.join(tmpdir, 'a', 'cache.json')))
+            stats = cache.stats()
+            # Checking for a spilled key doesn't load it
+            self.assertEqual((stats['spills'], stats['reloads']), (3, 2))
+
+            # Setting a key deletes its spilled value, so deleting it leaves nothing behind
+            cache['c'] = [3]
+            self.assertTrue(op.isfile(op.join(tmpdir, 'b', 'cache.json')))
+            cache['b'] = [4]
+            self.assertFalse(op.isfile(op.join(tmpdir, 'b', 'cache.json')))
+            cache['c'] = [5]
+            del cache['b']
+            self.assertNotIn('b', cache)
+            self.assertIsNone(cache.get('b'))
+            self.assertEqual(cache.pop('c'), [5])
+            self.assertEqual([f for _, _, files in os.walk(tmpdir) for f in files], [])
+
+
+class TestFingerprint(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.df = pd.read_csv(op.join(op.dirname(__file__), "data", "actors.csv"),
+                             encoding='utf8')
+
+    def test_digest(self):
+        df = self.df.copy()
+        fp = FrameFingerprint(df)
+        self.assertEqual(fp.digest(), FrameFingerprint(self.df).digest())
+        self.assertEqual(fp.digest(['name', 'votes']), fp.digest(['votes', 'name', 'foo']))
+        self.assertNotEqual(fp.digest(['name']), fp.digest(['votes']))
+
+        xdf = df.copy()
+        xdf.loc[0, 'votes'] += 1
+        xfp = FrameFingerprint(xdf)
+        self.assertNotEqual(fp.digest(), xfp.digest())
+        self.assertNotEqual(fp.digest(['votes']), xfp.digest(['votes']))
+        self.assertEqual(fp.digest(['name']), xfp.digest(['name']))
+        self.assertNotEqual(fp.digest(['name']), FrameFingerprint(df.iloc[:-1]).digest(['name']))
+
+        # Duplicate column names are hashed by position
+        dup = pd.DataFrame([[1, 2]], columns=['a', 'a'])
+        self.assertIsNotNone(FrameFingerprint(dup).digest())
+        self.assertEqual(FrameFingerprint(dup).digest(['a']), FrameFingerprint(dup).digest())
+        self.assertNotEqual(FrameFingerprint(dup).digest(),
+                            FrameFingerprint(pd.DataFrame([[2, 1]], columns=['a', 'a'])).digest())
+
+    def test_make_key(self):
+        self.assertEqual(make_key('x', {'a': 1, 'b': 2}), make_key('x', {'b': 2, 'a': 1}))
+        self.assertNotEqual(make_key('x', {'a': 1}), make_key('y', {'a': 1}))
+        self.assertIsNone(make_key('x', {'a': object()}))
+
+
+if __name__ == "__main__":
+    unittest.main()
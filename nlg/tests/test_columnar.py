@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Tests for the nlg.columnar module.
+"""
+
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from nlg import columnar
+
+op = os.path
+
+
+class TestColumnar(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.src = op.join(op.dirname(__file__), "data", "actors.csv")
+        cls.df = pd.read_csv(cls.src, encoding='utf8')
+
+    def test_roundtrip(self):
+        df = self.df.copy()
+        df['kind'] = df['category'].astype('category')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = op.join(tmpdir, 'actors.npy')
+            columnar.save(df, path)
+            actual = columnar.load(path)
+            pd.testing.assert_frame_equal(actual, df)
+            self.assertIsInstance(actual['rating'].values.base, np.memmap)
+            self.assertNotIsInstance(columnar.load(path, mmap=False)['rating'].values.base,
+                                     np.memmap)
+            actual = columnar.load(path, columns={'name', 'votes'})
+            self.assertListEqual(actual.columns.tolist(), ['name', 'votes'])
+            # Strings are stored as JSON, not pickled
+            self.assertFalse(any(f.endswith('.npy') and np.load(op.join(path, f)).dtype.hasobject
+                                 for f in os.listdir(path)))
+
+    def test_is_fresh(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = op.join(tmpdir, 'actors.csv')
+            path = op.join(tmpdir, '.cache', 'actors.csv.npy')
+            self.df.to_csv(src, index=False)
+            self.assertFalse(columnar.is_fresh(path, src))
+            columnar.save(self.df, path, src=src)
+            self.assertTrue(columnar.is_fresh(path, src))
+            time.sleep(0.01)
+            self.df.iloc[:5].to_csv(src, index=False)
+            self.assertFalse(columnar.is_fresh(path, src))
+            columnar.save(self.df.iloc[:5], path, src=src)
+            self.assertTrue(columnar.is_fresh(path, src))
+            self.assertEqual(len(columnar.load(path)), 5)
+            self.assertListEqual(os.listdir(op.dirname(path)), ['actors.csv.npy'])
+
+
+if __name__ == "__main__":
+    unittest.main()
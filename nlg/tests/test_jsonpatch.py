@@ -0,0 +1,50 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Tests for the nlg.jsonpatch module.
+"""
+
+import copy
+import unittest
+
+from nlg.jsonpatch import apply, diff
+
+
+class TestJSONPatch(unittest.TestCase):
+
+    def check(self, src, dst):
+        patch = diff(src, dst)
+        self.assertEqual(apply(copy.deepcopy(src), patch), dst)
+        return patch
+
+    def test_diff(self):
+        self.assertEqual(self.check({'a': 1}, {'a': 1}), [])
+        self.assertEqual(self.check({'a': 1, 'b': 2}, {'a': True, 'c': 3}), [
+            {'op': 'remove', 'path': '/b'},
+            {'op': 'replace', 'path': '/a', 'value': True},
+            {'op': 'add', 'path': '/c', 'value': 3}])
+        self.assertEqual(self.check({'a/b': {'~': 1}}, {'a/b': {'~': 2}}),
+                         [{'op': 'replace', 'path': '/a~1b/~0', 'value': 2}])
+        self.assertEqual(self.check([1, 2], {'x': 1}),
+                         [{'op': 'replace', 'path': '', 'value': {'x': 1}}])
+
+    def test_lists(self):
+        items = [{'name': str(i), 'tokens': list(range(i))} for i in range(5)]
+        # Deleting or inserting an item doesn't touch the items after it
+        self.assertEqual(self.check(items, items[:2] + items[3:]),
+                         [{'op': 'remove', 'path': '/2'}])
+        self.assertEqual(self.check(items, items[:1] + [{}] + items[1:]),
+                         [{'op': 'add', 'path': '/1', 'value': {}}])
+        changed = copy.deepcopy(items)
+        changed[3]['tokens'].append(9)
+        self.assertEqual(self.check(items, changed),
+                         [{'op': 'add', 'path': '/3/tokens/3', 'value': 9}])
+        self.check(items, items[::-1])
+        self.check(items, [])
+        self.check([], items)
+
+
+if __name__ == "__main__":
+    unittest.main()
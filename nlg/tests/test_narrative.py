@@ -6,15 +6,20 @@
 Tests for the nlg.narrative module.
 """
 
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import json
 import os
 import re
+import time
 import unittest
+from unittest.mock import MagicMock, patch
 
 import pandas as pd
 from spacy.tokens import Doc
 
-from nlg import templatize
-from nlg.narrative import Nugget, Narrative
+from nlg import templatize, utils
+from nlg.cache import LRUCache
+from nlg.narrative import Nugget, Narrative, Source
 from nlg.utils import load_spacy_model
 
 op = os.path
@@ -89,6 +94,27 @@ class TestNarrative(unittest.TestCase):
         self.assertEqual(rendered.lstrip().decode('utf8'),
                          'Ingrid Bergman is the actress with the highest rating.')
 
+    def test_var_index(self):
+        text = nlp('James Stewart is the actor with the highest rating.')
+        nugget = templatize(text, {'_sort': ['-rating']}, self.df)
+        self.assertIs(nugget.get_var('actor'), nugget.tokenmap[text[4]])
+        self.assertIs(nugget.get_var((0, 2)), nugget.tokenmap[text[0:2]])
+        with self.assertRaises(ValueError):
+            nugget.add_var(1, expr='df["name"].iloc[1]')
+        with self.assertRaises(ValueError):
+            nugget.add_var((1, 10), expr='df["name"].iloc[1]')
+        with self.assertRaises(KeyError):
+            nugget.get_var('highest')
+        nugget.add_var(7, expr='"highest"')
+        self.assertEqual(nugget.get_var('highest').enabled_source['tmpl'], '"highest"')
+        # Replacing a variable at the same token is allowed
+        nugget.add_var(7, expr='"lowest"')
+        self.assertEqual(nugget.get_var('highest').enabled_source['tmpl'], '"lowest"')
+
+        del nugget.tokenmap[text[0:2]]
+        nugget.add_var(1, expr='df["name"].iloc[1]')
+        self.assertIn(text[1], nugget.tokenmap)
+
     def test_serialize(self):
         pl = self.nugget.to_dict()
         self.assertEqual(pl['text'], self.text.text)
@@ -140,6 +166,32 @@ class TestNarrative(unittest.TestCase):
         actual = nugget.render(self.df).lstrip().decode('utf8')
         self.assertEqual(actual, self.text.text)
 
+    def test_source(self):
+        raw = {'location': 'cell', 'tmpl': 'df["name"].iloc[-1]', 'type': 'ne'}
+        source = Source(raw)
+        self.assertEqual(source['tmpl'], raw['tmpl'])
+        self.assertIsNone(source._tmpl)
+        source['enabled'] = True
+        self.assertEqual(json.dumps(source.to_dict()), json.dumps(dict(raw, enabled=True)))
+        self.assertEqual(source, dict(raw, enabled=True))
+        self.assertIsNone(source.get('varname'))
+        source['tmpl'] = 'df["name"].iloc[-1].upper()'
+        self.assertEqual(source['tmpl'], 'df["name"].iloc[-1].upper()')
+        source['tmpl'] = 'df.columns[2]'
+        self.assertEqual(source['tmpl'], 'df.columns[2]')
+        self.assertEqual(source._args, (2,))
+        with self.assertRaises(AttributeError):
+            source.foo = 'bar'
+
+        pl = self.nugget.to_dict()
+        nugget = Nugget.from_json(json.loads(json.dumps(pl)))
+        self.assertEqual(json.dumps(nugget.to_dict()), json.dumps(pl))
+        for variable in nugget.tokenmap.values():
+            self.assertFalse(hasattr(variable, '__dict__'))
+            for source in variable.sources:
+                self.assertIsInstance(source, Source)
+        self.assertFalse(hasattr(nugget, '__dict__'))
+
     def test_doc_serialize(self):
         nugget = templatize(nlp('Humphrey Bogart'), {}, self.df)
         pl = nugget.to_dict()
@@ -154,6 +206,30 @@ class TestNarrative(unittest.TestCase):
         source = var_serialized['sources'][0]
         self.assertEqual(source['tmpl'], 'df["name"].iloc[0]')
 
+    def test_doc_payload(self):
+        pl = self.nugget.to_dict(doc=True)
+        self.assertEqual(pl['doc']['model'], 'en_core_web_sm')
+        self.assertNotIn('doc', self.nugget.to_dict())
+        spy = MagicMock(wraps=nlp)
+        spy.meta, spy.vocab = nlp.meta, nlp.vocab
+        with patch('nlg.narrative.nlp', spy):
+            nugget = Nugget.from_json(json.loads(json.dumps(pl)))
+            spy.assert_not_called()
+            self.assertEqual(nugget.render(self.df), self.nugget.render(self.df))
+            self.assertListEqual([t.tag_ for t in nugget.doc], [t.tag_ for t in self.text])
+
+            # Docs from other models are parsed again
+            pl = self.nugget.to_dict(doc=True)
+            pl['doc']['version'] = '0.0.0'
+            nugget = Nugget.from_json(pl)
+            spy.assert_called_once_with(self.text.text)
+            self.assertEqual(nugget.render(self.df), self.nugget.render(self.df))
+
+        narrative = Narrative([self.nugget])
+        pl = narrative.to_dict(doc=True)
+        self.assertIn('doc', pl['narrative'][0])
+        self.assertEqual(Narrative.from_json(pl).render(df=self.df), narrative.render(df=self.df))
+
     def test_narrative_html(self):
         text = nlp('Katharine Hepburn is the actress with the least rating.')
         fh_args = {'_sort': ['-rating']}
@@ -209,6 +285,269 @@ class TestNarrative(unittest.TestCase):
         ]
         self.assertListEqual(actual, ideal)
 
+    def test_render_rows(self):
+        actual = self.nugget.render_rows(self.df)
+        ideal = [self.nugget.render(self.df.iloc[[i]]).decode('utf8').strip()
+                 for i in range(len(self.df))]
+        self.assertTrue(actual.index.equals(self.df.index))
+        self.assertListEqual(actual.tolist(), ideal)
+
+        # conditions and expressions that cannot be vectorized
+        nugget = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        nugget.get_var(0).set_expr('df["name"].iloc[0].upper() + " (" + str(len(df)) + ")"')
+        nugget.condition = 'df["votes"].iloc[0] > 120'
+        actual = nugget.render_rows(self.df)
+        ideal = [nugget.render(self.df.iloc[[i]]).decode('utf8').strip()
+                 for i in range(len(self.df))]
+        self.assertListEqual(actual.tolist(), ideal)
+        self.assertIn('CARY GRANT (1)', ideal)
+        self.assertIn('', ideal)
+
+    def test_render_rows_escape(self):
+        # Values are escaped and formatted as in render(), including datetimes and NaT
+        df = self.df.head(4).copy()
+        df['name'] = ["Rock 'n' Roll", 'A & B', '<b>', 'Cary Grant']
+        df['when'] = pd.to_datetime(['2020-01-01', None, '2021-06-01 10:30', '2022-01-01'],
+                                    format='mixed')
+        df['zoned'] = df['when'].dt.tz_localize('Asia/Kolkata')
+        nugget = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        var = nugget.get_var(0)
+        for expr in ('df["name"].iloc[0]', 'df["when"].iloc[0]', 'df["zoned"].iloc[0]'):
+            var.set_expr(expr)
+            actual = nugget.render_rows(df)
+            ideal = [nugget.render(df.iloc[[i]]).decode('utf8').strip() for i in range(len(df))]
+            self.assertListEqual(actual.tolist(), ideal)
+        self.assertIn('NaT', ideal)
+        # FormHandler arguments may be passed, as in render()
+        actual = nugget.render_rows(df, fh_args={'_sort': ['name']})
+        self.assertEqual(len(actual), len(df))
+
+    def test_columns(self):
+        nugget = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        self.assertSetEqual(nugget.columns, {'name'})
+        nugget.condition = 'df["votes"].sum() > 0'
+        nugget.fh_args = {'category': ['Actresses'], '_sort': ['-votes']}
+        self.assertSetEqual(nugget.columns, {'category', 'name', 'votes'})
+        self.assertListEqual(nugget.to_dict()['columns'], ['category', 'name', 'votes'])
+        self.assertEqual(nugget.render(self.df).strip(), b'Audrey Hepburn')
+
+        nugget.get_var(0).set_expr('df.columns[1]')
+        self.assertIsNone(nugget.columns)
+        self.assertIsNone(nugget.to_dict()['columns'])
+        self.assertIsNone(Narrative([nugget, self.nugget]).to_dict()['columns'])
+        nugget.get_var(0).set_expr('df["name"].iloc[0]')
+        self.assertListEqual(Narrative([nugget]).to_dict()['columns'],
+                             ['category', 'name', 'votes'])
+
+    def test_render_cache(self):
+        cache = LRUCache()
+        nugget = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        ideal = nugget.render(self.df)
+        self.assertEqual(nugget.render(self.df, cache=cache), ideal)
+        self.assertEqual(nugget.render(self.df, cache=cache), ideal)
+        self.assertEqual(nugget.render(self.df.copy(), cache=cache), ideal)
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(len(cache), 1)
+
+        # Changes in the data or the nugget are rendered afresh
+        xdf = self.df.iloc[::-1]
+        self.assertEqual(nugget.render(xdf, cache=cache).strip(), b'Charlie Chaplin')
+        nugget.condition = 'False'
+        self.assertEqual(nugget.render(xdf, cache=cache).strip(), b'')
+        self.assertEqual(len(cache), 3)
+
+        # Columns that the nugget doesn't use don't matter
+        nugget.condition = None
+        xdf = self.df.copy()
+        xdf['votes'] = 0
+        self.assertEqual(nugget.render(xdf, cache=cache), ideal)
+        self.assertEqual(cache.stats()['hits'], 3)
+
+        narrative = Narrative([nugget])
+        self.assertEqual(narrative.to_html(df=self.df, cache=cache),
+                         narrative.to_html(df=self.df))
+        self.assertEqual(len(cache), 4)
+
+    def test_rerender(self):
+        name = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        votes = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        votes.get_var(0).set_expr('df["votes"].max()')
+        narrative = Narrative([name, votes])
+        self.assertEqual(narrative.rerender(self.df), narrative.render(df=self.df))
+        self.assertListEqual(narrative.rerendered, [0, 1])
+        self.assertEqual(narrative.rerender(self.df.copy()), narrative.render(df=self.df))
+        self.assertListEqual(narrative.rerendered, [])
+
+        xdf = self.df.copy()
+        xdf.loc[0, 'votes'] = 1000
+        actual = narrative.rerender(xdf)
+        self.assertListEqual(narrative.rerendered, [1])
+        self.assertEqual(actual, narrative.render(df=xdf))
+        self.assertEqual(re.sub(r'\s+', ' ', actual).strip(), 'Humphrey Bogart 1000')
+
+        votes.condition = 'False'
+        narrative.rerender(xdf)
+        self.assertListEqual(narrative.rerendered, [1])
+
+    def test_evaluate(self):
+        name = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        votes = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        votes.get_var(0).set_expr('df["votes"].max()')
+        same = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        same.condition = 'len(df) > 0'
+        narrative = Narrative([name, votes, same])
+        values, stats = narrative.evaluate(self.df, return_stats=True)
+        self.assertEqual(values[0]['df["name"].iloc[0]'], 'Humphrey Bogart')
+        self.assertEqual(values[1]['df["votes"].max()'], self.df['votes'].max())
+        self.assertDictEqual(stats,
+                             {'scopes': 1, 'expressions': 4, 'evaluations': 3, 'saved': 1})
+        # Nuggets rendered by Tornado aren't counted
+        tornado = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        tornado.condition = 'len(df) > 0'
+        tornado.get_var(0).varname = 'who'
+        _, stats = Narrative([tornado]).evaluate(self.df, return_stats=True)
+        self.assertDictEqual(stats,
+                             {'scopes': 1, 'expressions': 0, 'evaluations': 0, 'saved': 0})
+        expected = ' '.join([re.sub(r'\s+', ' ', c.render(self.df).decode('utf8')).strip()
+                             for c in narrative])
+        self.assertEqual(narrative.render(df=self.df, cse=True), expected)
+        html = narrative.to_html(df=self.df, cse=True)
+        self.assertIn('<strong>Humphrey Bogart</strong>', html)
+
+        same.condition = 'len(df) > 1000'
+        self.assertIsNone(narrative.evaluate(self.df)[2])
+        self.assertEqual(narrative.render(df=self.df, cse=True, sep='|').split('|')[2], '')
+
+    def test_render_values(self):
+        name = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        votes = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        votes.get_var(0).set_expr('df["votes"].max()')
+        votes.condition = 'len(df) > 1'
+        narrative = Narrative([name, votes])
+        actual = narrative.render_values(self.df)
+        self.assertEqual(actual['version'], narrative.template_version)
+        self.assertDictEqual(actual['values'], {
+            0: {0: 'Humphrey Bogart'}, 1: {0: str(self.df['votes'].max())}})
+        self.assertDictEqual(narrative.render_values(self.df.iloc[1:2])['values'], {
+            0: {0: self.df['name'].iloc[1]}, 1: None})
+        json.dumps(actual)
+        # Values are escaped just like the rendered text
+        df = self.df.assign(name=self.df['name'] + ' <&>')
+        self.assertEqual(narrative.render_values(df)['values'][0][0],
+                         df['name'].iloc[0].replace('<&>', '&lt;&amp;&gt;'))
+
+        version = narrative.template_version
+        votes.get_var(0).set_expr('df["votes"].min()')
+        self.assertNotEqual(narrative.template_version, version)
+
+    def test_render_formats(self):
+        text = nlp('Katharine Hepburn is the actress with the least rating.')
+        narrative = Narrative([self.nugget, templatize(text, {'_sort': ['-rating']}, self.df)])
+        actual = narrative.render_formats(self.df)
+        self.assertEqual(narrative.evaluate(self.df, return_stats=True)[1]['scopes'], 1)
+        self.assertSetEqual(set(actual), {'html', 'markdown', 'text'})
+        self.assertEqual(actual['text'], narrative.render(df=self.df, cse=True))
+        self.assertEqual(actual['html'], narrative.to_html(df=self.df, cse=True))
+        self.assertEqual(
+            actual['markdown'],
+            narrative.to_html(df=self.df, cse=True, style='list', liststyle='markdown',
+                              bold=False))
+        self.assertTrue(actual['markdown'].startswith('* '))
+
+        actual = narrative.render_formats(self.df, {'em': {'italic': True, 'bold': False}})
+        self.assertEqual(actual['em'], narrative.to_html(
+            df=self.df, cse=True, italic=True, bold=False))
+        self.assertIn('<em>', actual['em'])
+
+    def test_concurrent_render(self):
+        name = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        votes = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        votes.get_var(0).set_expr('df["votes"].max()')
+        narrative = Narrative([name, votes])
+        styles = [
+            {'bold': True, 'italic': False, 'underline': False},
+            {'bold': False, 'italic': True, 'underline': True},
+            {'bold': False, 'italic': False, 'underline': False},
+        ]
+        args = [None, {'_sort': ['-rating']}, {'category': ['Actresses']}]
+        jobs = [(style, fh_args) for style in styles for fh_args in args] * 10
+
+        def render(job):
+            style, fh_args = job
+            return narrative.to_html(df=self.df, fh_args=fh_args, **style)
+
+        expected = [render(job) for job in jobs]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            actual = list(pool.map(render, jobs))
+        self.assertListEqual(actual, expected)
+        self.assertEqual(len(set(expected)), len(styles) * len(args))
+        # Rendering does not modify the nuggets
+        self.assertEqual(name.fh_args, {})
+        self.assertEqual(name.template, '{{ df["name"].iloc[0] }}')
+
+    def test_parallel_render(self):
+        text = nlp('Katharine Hepburn is the actress with the least rating.')
+        narrative = Narrative([self.nugget, templatize(text, {'_sort': ['-rating']}, self.df)])
+        expected = narrative.render(df=self.df)
+        html = narrative.to_html(df=self.df, style='list')
+        for executor in ('thread', 'process', ThreadPoolExecutor(max_workers=2)):
+            self.assertEqual(narrative.render(df=self.df, executor=executor), expected)
+            self.assertEqual(
+                narrative.to_html(df=self.df, style='list', executor=executor), html)
+
+        slow = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        slow.get_var(0).set_expr('sleep(0.5) or df["name"].iloc[0]')
+        narrative.append(slow)
+        with self.assertRaises(TimeoutError):
+            narrative.render(df=self.df, sleep=time.sleep, executor='thread', timeout=0.1)
+        actual = narrative.render(df=self.df, sleep=time.sleep, executor='thread', timeout=5)
+        self.assertTrue(actual.endswith('Humphrey Bogart'))
+
+    def test_iter_render(self):
+        text = nlp('Katharine Hepburn is the actress with the least rating.')
+        narrative = Narrative([self.nugget, templatize(text, {'_sort': ['-rating']}, self.df)])
+        chunks = list(narrative.iter_render(df=self.df, sep='|'))
+        self.assertEqual(len(chunks), 2)
+        self.assertTrue(chunks[1].startswith('|'))
+        self.assertEqual(''.join(chunks), narrative.render(df=self.df, sep='|'))
+        for style, liststyle in [('para', 'html'), ('list', 'html'), ('list', 'markdown')]:
+            kwargs = dict(style=style, liststyle=liststyle, italic=True)
+            chunks = list(narrative.iter_html(df=self.df, **kwargs))
+            self.assertEqual(''.join(chunks), narrative.to_html(df=self.df, **kwargs))
+        chunks = list(narrative.iter_html(df=self.df, style='list', executor='thread'))
+        self.assertEqual(chunks[0], '<ul>')
+        self.assertEqual(chunks[-1], '</ul>')
+        self.assertTrue(chunks[1].startswith('<li>'))
+        with self.assertRaises(ValueError):
+            narrative.to_html(df=self.df, style='list', liststyle='rst')
+
+    def test_lazy_condition(self):
+        text = nlp('James Stewart is the actor with the highest rating.')
+        nugget = templatize(text, {'_sort': ['-rating']}, self.df)
+        nugget.condition = 'len(orgdf) > 1000'
+        self.assertTrue(nugget.template.startswith('{% if len(orgdf) > 1000 %}'))
+        with patch('nlg.utils.gfilter', wraps=utils.gfilter) as gfilter:
+            self.assertRegex(nugget.render(self.df).decode('utf8'), r'^\s*$')
+            self.assertIsNone(Narrative([nugget]).evaluate(self.df)[0])
+            gfilter.assert_not_called()
+            nugget.condition = 'len(orgdf) > 10'
+            self.assertEqual(nugget.render(self.df).decode('utf8').strip(), text.text)
+            self.assertEqual(Narrative([nugget]).render(df=self.df, cse=True), text.text)
+            self.assertEqual(gfilter.call_count, 2)
+
+        # Conditions on the filtered data are checked after filtering
+        nugget.condition = 'df["rating"].iloc[0] > 0.9'
+        self.assertTrue(nugget.template.startswith('{% set fh_args'))
+        self.assertEqual(nugget.render(self.df).decode('utf8').strip(), text.text)
+
+        # Data is not filtered if no variable needs it
+        nugget = templatize(nlp('Humphrey Bogart'), {}, self.df)
+        nugget.fh_args = {'_sort': ['-rating']}
+        nugget.get_var(0).set_expr('orgdf["name"].iloc[0]')
+        nugget.condition = 'True'
+        self.assertNotIn('gfilter', nugget.template)
+        self.assertEqual(nugget.render(self.df).decode('utf8').strip(), 'Humphrey Bogart')
+
     def test_condition(self):
         try:
             self.nugget.condition = 'df["category"].nunique() == 2'
@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Tests for the nlg.nlpservice module.
+"""
+
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from spacy.tokens import Doc
+
+from nlg import nlpservice, utils
+from nlg.narrative import _dump_doc
+
+TEXT = "James Stewart is the actor with the highest rating of 9 votes."
+
+
+def _attrs(doc):
+    return [(t.text, t.lemma_, t.pos_, t.tag_, t.dep_, t.head.i, t.ent_type_, t.is_stop)
+            for t in doc]
+
+
+class TestNLPService(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = nlpservice.make_server(('127.0.0.1', 0), b'test', workers=1, delay=0.05)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.client = nlpservice.NLPClient(cls.server.address, b'test')
+        cls.nlp = utils.load_spacy_model()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.batcher.shutdown()
+
+    def test_parse(self):
+        doc = self.client(TEXT)
+        self.assertEqual(_attrs(doc), _attrs(self.nlp(TEXT)))
+        self.assertEqual([c.text for c in doc.noun_chunks],
+                         [c.text for c in self.nlp(TEXT).noun_chunks])
+        self.assertEqual(self.client.meta['version'], self.nlp.meta['version'])
+        docs = self.client.pipe(['Humphrey Bogart is an actor.', TEXT])
+        self.assertEqual(_attrs(docs[1]), _attrs(doc))
+        self.assertIs(docs[0].vocab, doc.vocab)
+
+    def test_batching(self):
+        before = self.server.batcher.stats()
+        texts = [f'Actor {i} has {i} votes.' for i in range(16)]
+        with ThreadPoolExecutor(8) as pool:
+            docs = list(pool.map(self.client, texts))
+        self.assertEqual([d.text for d in docs], texts)
+        stats = self.server.batcher.stats()
+        self.assertEqual(stats['requests'] - before['requests'], 16)
+        self.assertLess(stats['batches'] - before['batches'], 16)
+
+    def test_authkey(self):
+        with self.assertRaises(ValueError):
+            nlpservice.make_server(('127.0.0.1', 0), b'')
+        with self.assertRaises(ValueError):
+            nlpservice.NLPClient(self.server.address, b'')
+        with self.assertRaises(SystemExit):
+            nlpservice.main(['--authkey', ''])
+
+    def test_broken_pool(self):
+        batcher = self.server.batcher
+        executor = batcher.executor
+        # A broken pool is replaced
+        batcher.executor = MagicMock(submit=MagicMock(side_effect=BrokenProcessPool()))
+        try:
+            self.assertEqual(len(self.client.pipe([TEXT])), 1)
+            self.assertIsNot(batcher.executor, executor)
+        finally:
+            executor.shutdown()
+        # If that fails too, requests fail instead of waiting forever
+        executor = batcher.executor
+        broken = MagicMock(submit=MagicMock(side_effect=BrokenProcessPool()))
+        batcher.executor = broken
+        batcher._new_executor = MagicMock(return_value=broken)
+        try:
+            for _ in range(2):
+                with self.assertRaises(BrokenProcessPool):
+                    batcher.parse([TEXT])
+        finally:
+            del batcher._new_executor
+            batcher.executor = executor
+        self.assertEqual(len(self.client.pipe([TEXT])), 1)
+
+    def test_doc_payload(self):
+        # Docs serialized by a process with the full model can be read by a client
+        payload = _dump_doc(self.nlp(TEXT))
+        client = nlpservice.NLPClient(self.server.address, b'test')
+        for string in payload['strings']:
+            client.vocab.strings.add(string)
+        doc = Doc(client.vocab).from_bytes(base64.b64decode(payload['bytes']))
+        self.assertEqual(_attrs(doc), _attrs(self.nlp(TEXT)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Tests for the nlg.payload module.
+"""
+
+import json
+import os
+import unittest
+
+import pandas as pd
+
+from nlg import payload
+
+op = os.path
+
+
+class TestPayload(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.df = pd.read_csv(op.join(op.dirname(__file__), 'data', 'actors.csv'),
+                             encoding='utf8')
+        cls.meta = {'nrid': 'narrative', 'args': {'_sort': ['-rating']}}
+
+    def test_json(self):
+        body = dict(self.meta, data=self.df.to_dict(orient='records'))
+        meta, df = payload.read(json.dumps(body).encode('utf8'), 'application/json')
+        self.assertDictEqual(meta, self.meta)
+        pd.testing.assert_frame_equal(df, self.df)
+        # Columns, with any content type that isn't binary
+        body = dict(self.meta, data=self.df.to_dict(orient='list'))
+        meta, df = payload.read(json.dumps(body).encode('utf8'), 'text/plain;charset=UTF-8')
+        self.assertDictEqual(meta, self.meta)
+        pd.testing.assert_frame_equal(df, self.df)
+
+    def test_frame(self):
+        df = self.df.assign(flag=self.df['rating'] > 0.5,
+                            when=pd.date_range('2020-01-01', periods=len(self.df)))
+        body = payload.dumps(df, self.meta)
+        meta, actual = payload.read(body, payload.FRAME_TYPE + '; charset=binary')
+        self.assertDictEqual(meta, self.meta)
+        pd.testing.assert_frame_equal(actual, df)
+        self.assertFalse(actual['rating'].values.flags.owndata)
+        with self.assertRaises(ValueError):
+            payload.read(b'NOPE' + body[4:], payload.FRAME_TYPE)
+        # Truncated bodies raise a ValueError, which the webapp reports as a bad request
+        for size in (0, 6, 20, len(body) - 1):
+            with self.assertRaises(ValueError):
+                payload.read(body[:size], payload.FRAME_TYPE)
+
+    def test_arrow(self):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise unittest.SkipTest('pyarrow is not installed')
+        table = pa.Table.from_pandas(self.df, preserve_index=False)
+        table = table.replace_schema_metadata({'nlg': json.dumps(self.meta)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        meta, df = payload.read(sink.getvalue().to_pybytes(), payload.ARROW_TYPE)
+        self.assertDictEqual(meta, self.meta)
+        pd.testing.assert_frame_equal(df, self.df)
+
+
+if __name__ == "__main__":
+    unittest.main()
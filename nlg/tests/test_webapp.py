@@ -1,9 +1,18 @@
+import json
 import os
+import tempfile
+import threading
+import time
 from unittest import TestCase
+from unittest.mock import MagicMock, patch
 
+import numpy as np
 import pandas as pd
+from tornado.web import HTTPError
 
 from nlg import templatize
+from nlg.jsonpatch import apply
+from nlg.narrative import Narrative, Nugget
 from nlg.utils import load_spacy_model
 from nlg import webapp as app
 
@@ -53,3 +62,246 @@ class TestWebApp(TestCase):
         template = nugget.to_dict()
         actual = app.get_preview_html(template)
         self.assertEqual(actual, ideal)
+
+    def test_read_dataset(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = op.join(tmpdir, 'actors.csv')
+            self.df.to_csv(path, index=False)
+            df = app.read_dataset(path)
+            pd.testing.assert_frame_equal(df, self.df)
+            self.assertIs(app.read_dataset(path), df)
+
+            time.sleep(0.01)
+            self.df.iloc[:5].to_csv(path, index=False)
+            xdf = app.read_dataset(path)
+            self.assertEqual(len(xdf), 5)
+            self.assertEqual(len([k for k, _ in app.DATASET_CACHE.items() if k[0] == path]), 1)
+
+    def test_convert_dataset(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = op.join(tmpdir, 'actors.csv')
+            self.df.to_csv(path, index=False)
+            app.convert_dataset_async(path).result()
+            self.assertTrue(op.isdir(op.join(tmpdir, '.cache', 'actors.csv.npy')))
+            app.DATASET_CACHE.clear()
+            df = app.read_dataset(path)
+            pd.testing.assert_frame_equal(df, self.df)
+            self.assertIsInstance(df['rating'].values.base, np.memmap)
+
+    def test_bounded_pool(self):
+        pool = app.BoundedPool(max_workers=1, max_queue=1)
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+            return 'done'
+
+        running = pool.submit(block)
+        started.wait(5)
+        waiting = pool.submit(str, 1)
+        stats = pool.stats()
+        self.assertEqual((stats['running'], stats['queued']), (1, 1))
+        with self.assertRaises(HTTPError) as ctx:
+            pool.submit(str, 2)
+        self.assertEqual(ctx.exception.status_code, 503)
+        release.set()
+        self.assertEqual(running.result(), 'done')
+        self.assertEqual(waiting.result(), '1')
+        stats = pool.stats()
+        self.assertEqual((stats['completed'], stats['rejected'], stats['queued']), (2, 1, 0))
+        self.assertGreater(stats['wait_max'], 0)
+
+    def test_read_saved_narrative(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = op.join(tmpdir, 'narrative.json')
+            with open(path, 'w', encoding='utf8') as fout:
+                json.dump(Narrative([self.nugget]).to_dict(doc=True), fout)
+            narrative = app.read_saved_narrative(path)
+            self.assertIs(app.read_saved_narrative(path), narrative)
+            # Rewriting the file reloads the narrative
+            with open(path, 'w', encoding='utf8') as fout:
+                json.dump(Narrative([self.nugget, self.nugget]).to_dict(doc=True), fout)
+            os.utime(path, ns=(0, time.time_ns() + 10 ** 9))
+            self.assertEqual(len(app.read_saved_narrative(path)), 2)
+
+    def test_render_batch(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(op.join(tmpdir, 'narrative.json'), 'w', encoding='utf8') as fout:
+                json.dump(Narrative([self.nugget]).to_dict(doc=True), fout)
+            self.df.to_csv(op.join(tmpdir, 'actors.csv'), index=False)
+            body = {'nrid': 'narrative', 'dataset': 'actors.csv', 'partition': 'category'}
+            handler = MagicMock(args={})
+            handler.request.headers = {'Content-Type': 'application/json'}
+            handler.request.body = json.dumps(body).encode('utf8')
+            with patch.object(app, 'get_user_dir', return_value=tmpdir):
+                lines = app.render_batch(handler).result().splitlines()
+                lines = [json.loads(line) for line in lines]
+                self.assertEqual([line['key'] for line in lines],
+                                 [{'category': c} for c in self.df['category'].unique()])
+                for line, (_, group) in zip(lines, self.df.groupby('category', sort=False)):
+                    best = group.sort_values('rating').iloc[-1]
+                    self.assertIn(best['name'], line['html'])
+
+                # Each FormHandler argument is applied to the whole narrative. Streamed.
+                fh_args = [{'_sort': ['rating']}, {'_sort': ['-votes']}, 'nope']
+                body = dict(body, fh_args=fh_args, partition=None)
+                handler.request.body = json.dumps(body).encode('utf8')
+                handler.args = {'_stream': ['1']}
+                chunks = [f.result() for f in app.render_batch(handler)]
+                self.assertIsNone(chunks[-1])
+                lines = [json.loads(chunk) for chunk in chunks[:-1]]
+                self.assertEqual([line['key'] for line in lines], fh_args)
+                for line, args in zip(lines[:2], fh_args):
+                    name = self.df.sort_values(args['_sort'][0].strip('-'),
+                                               ascending='-' not in args['_sort'][0])
+                    self.assertIn(name['name'].iloc[0], line['html'])
+                self.assertIn('error', lines[2])
+
+                # Requests without data are rejected
+                handler.request.body = json.dumps({'nrid': 'narrative'}).encode('utf8')
+                for func in (app.render_batch, app.render_live_template.sync,
+                             app.process_text.sync):
+                    with self.assertRaises(HTTPError) as cm:
+                        func(handler)
+                    self.assertEqual(cm.exception.status_code, 400)
+                # Narratives are read only from the user's directory
+                self.assertEqual(app._saved_narrative_path(handler, '../../narrative'),
+                                 op.join(tmpdir, 'narrative.json'))
+
+    def test_conditional(self):
+        user = 'test_conditional'
+        handler = MagicMock(args={}, current_user=MagicMock(id=user))
+        handler.request.headers = {}
+        app.NARRATIVE_CACHE[user] = Narrative([self.nugget])
+        try:
+            body = app.get_narrative_cache(handler).result()
+            self.assertEqual(body, json.dumps(app.NARRATIVE_CACHE[user].to_dict()))
+            (name, etag), _ = handler.set_header.call_args
+            self.assertEqual(name, 'ETag')
+            # Unchanged narratives are served from the memo, or not at all if the client has them
+            self.assertEqual(app.get_narrative_cache(handler), body)
+            handler.request.headers = {'If-None-Match': f'"x", W/{etag}'}
+            self.assertIsNone(app.get_narrative_cache(handler))
+            handler.set_status.assert_called_once_with(304)
+            # Changed narratives have a new ETag
+            app.NARRATIVE_CACHE[user][0].name = 'renamed'
+            handler.set_status.reset_mock()
+            self.assertIn('renamed', app.get_narrative_cache(handler).result())
+            handler.set_status.assert_not_called()
+            self.assertNotEqual(handler.set_header.call_args[0][1], etag)
+        finally:
+            app.NARRATIVE_CACHE.pop(user)
+
+    def test_render_narrative_etag(self):
+        user = 'test_render_narrative_etag'
+        app.NARRATIVE_CACHE[user] = Narrative(
+            [Nugget.from_json(self.nugget.to_dict(doc=True))])
+
+        def render(headers=None, **args):
+            handler = MagicMock(args={k: [v] for k, v in args.items()},
+                                current_user=MagicMock(id=user))
+            handler.request.headers = headers or {}
+            result = app.render_narrative(handler)
+            result = result.result() if hasattr(result, 'result') else result
+            return handler, result
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = op.join(tmpdir, 'actors.csv')
+            self.df.to_csv(path, index=False)
+            try:
+                with patch.object(app, '_dataset_path', return_value=path):
+                    handler, bold = render(bold='true')
+                    etag = handler.set_header.call_args[0][1]
+                    self.assertIn('<strong>', bold['render'])
+                    render(bold='false', italic='true')
+                    self.assertEqual(app.NARRATIVE_CACHE[user].html_style['italic'], True)
+                    # Repeated requests are served from the memo, or not at all...
+                    handler, result = render(bold='true')
+                    self.assertEqual(handler.set_header.call_args[0][1], etag)
+                    self.assertEqual(result, bold)
+                    handler, result = render({'If-None-Match': etag}, bold='true')
+                    self.assertIsNone(result)
+                    handler.set_status.assert_called_once_with(304)
+                    # ... but still save the style that the user sees
+                    style = app.NARRATIVE_CACHE[user].html_style
+                    self.assertEqual((style['bold'], style['italic']), (True, False))
+                    # Edits change the ETag
+                    with app.editing(user) as narrative:
+                        narrative[0].condition = 'True'
+                    handler, _ = render(bold='true')
+                    self.assertNotEqual(handler.set_header.call_args[0][1], etag)
+            finally:
+                app.NARRATIVE_CACHE.pop(user)
+
+    def test_editing(self):
+        user = 'test_editing'
+        handler = MagicMock(args={'condition': ['False']}, path_args=['0'],
+                            current_user=MagicMock(id=user))
+        app.NARRATIVE_CACHE[user] = Narrative(
+            [Nugget.from_json(self.nugget.to_dict(doc=True)) for _ in range(2)])
+        condition = app.NARRATIVE_CACHE[user][0].condition
+        try:
+            # Edits wait for renders, which hold the lock of the narrative
+            lock = app.narrative_lock(user)
+            with lock:
+                thread = threading.Thread(target=app.add_condition, args=(handler, ))
+                thread.start()
+                thread.join(0.1)
+                self.assertTrue(thread.is_alive())
+                self.assertEqual(app.NARRATIVE_CACHE[user][0].condition, condition)
+            thread.join()
+            self.assertEqual(app.NARRATIVE_CACHE[user][0].condition, 'False')
+            # Edits are kept even if the narrative leaves the cache while it is edited
+            with app.editing(user) as narrative:
+                app.NARRATIVE_CACHE.pop(user)
+                narrative[0].name = 'kept'
+            self.assertEqual(app.NARRATIVE_CACHE[user][0].name, 'kept')
+            with self.assertRaises(KeyError):
+                with app.editing('test_editing_nobody'):
+                    pass
+            # Edits change the revision of the narrative, which identifies renders
+            revision = app.revision(app.NARRATIVE_CACHE[user])
+            self.assertEqual(app.revision(app.NARRATIVE_CACHE[user]), revision)
+            app.add_condition(handler)
+            self.assertNotEqual(app.revision(app.NARRATIVE_CACHE[user]), revision)
+        finally:
+            app.NARRATIVE_CACHE.pop(user)
+
+    def test_versioned(self):
+        user = 'test_versioned'
+        handler = MagicMock(args={'_version': ['']}, path_args=['0'],
+                            current_user=MagicMock(id=user))
+        app.NARRATIVE_CACHE[user] = Narrative(
+            [Nugget.from_json(self.nugget.to_dict(doc=True)) for _ in range(2)])
+        try:
+            full = app.get_nugget(handler).result()
+            self.assertIsNone(full['base'])
+            self.assertEqual(len(full['patch']), 1)
+            nugget = apply(None, full['patch'])
+            self.assertEqual(nugget['template'], self.nugget.template)
+            # Edits are sent as a patch against the version the client has
+            app.NARRATIVE_CACHE[user][0].condition = 'len(df) > 1'
+            handler.args = {'_version': [full['version']]}
+            result = app.get_nugget(handler).result()
+            self.assertEqual(result['base'], full['version'])
+            self.assertEqual([(op['op'], op['path']) for op in result['patch']],
+                             [('replace', '/condition'), ('replace', '/template')])
+            nugget = apply(nugget, result['patch'])
+            current = app.get_nugget(MagicMock(args={}, path_args=['0'],
+                                               current_user=handler.current_user))
+            self.assertEqual(nugget, json.loads(json.dumps(current)))
+            # Unknown versions get the whole document
+            handler.args = {'_version': ['unknown']}
+            result = app.get_nugget(handler).result()
+            self.assertIsNone(result['base'])
+            self.assertEqual(apply(None, result['patch']), nugget)
+            # Deleting a nugget patches the narrative
+            narrative = apply(None, app.get_narrative_cache(handler).result()['patch'])
+            version = app.make_key(narrative)
+            handler.args = {'_version': [version], 'delete': ['']}
+            result = app.get_nugget(handler).result()
+            self.assertEqual(result['patch'][0], {'op': 'remove', 'path': '/narrative/0'})
+            self.assertEqual(len(apply(narrative, result['patch'])['narrative']), 1)
+        finally:
+            app.NARRATIVE_CACHE.pop(user)
@@ -4,6 +4,7 @@
 """
 Miscellaneous utilities.
 """
+import os
 import os.path as op
 import re
 
@@ -37,10 +38,20 @@ def _locate_app_config():
 
 
 def load_spacy_model():
-    """Load the spacy model when required."""
+    """Load the spacy model when required.
+
+    If the ``NLG_NLP_SERVICE`` environment variable is set to the ``host:port`` of an
+    NLP service, a client for it is returned instead. See `nlg.nlpservice`.
+    """
     if not _spacy['model']:
-        from spacy import load
-        nlp = load('en_core_web_sm')
+        address = os.environ.get('NLG_NLP_SERVICE')
+        if address:
+            from nlg.nlpservice import NLPClient
+            authkey = os.environ.get('NLG_NLP_AUTHKEY', '').encode('utf8')
+            nlp = NLPClient(address, authkey)
+        else:
+            from spacy import load
+            nlp = load('en_core_web_sm')
         _spacy['model'] = nlp
     else:
         nlp = _spacy['model']
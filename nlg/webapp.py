@@ -5,23 +5,187 @@
 Module for gramex exposure. This shouldn't be imported anywhere, only for use
 with gramex.
 """
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
 import glob
 import json
 import os
 import os.path as op
+import threading
+import time
+import uuid
 
 from gramex.config import variables
 from gramex.config import app_log  # noqa: F401
 import pandas as pd
 from tornado.template import Loader
+from tornado.web import HTTPError
 
-from nlg import utils, templatize, grammar_options
-from nlg.narrative import Narrative
+from nlg import binary, columnar, jsonpatch, utils, templatize, grammar_options
+from nlg.cache import LRUCache, SpillCache, make_key
+from nlg.narrative import Narrative, RENDER_CACHE
+from nlg.payload import read as _read_body
 
 DATAFILE_EXTS = {'.csv', '.xls', '.xlsx', '.tsv'}
-NARRATIVE_CACHE = {}
+# Rough memory used by a parsed token, used to estimate the size of narratives
+_TOKEN_BYTES = 2048
 
 nlg_path = op.join(variables['GRAMEXDATA'], 'nlg')
+
+
+def _narrative_spill_path(user_id):
+    return op.join(nlg_path, user_id, '.narrative.nlgb')
+
+
+def _narrative_size(narrative):
+    if isinstance(narrative, binary.LazyNarrative):
+        # Don't load nuggets just to measure them
+        return _TOKEN_BYTES * narrative.ntokens
+    return _TOKEN_BYTES * sum(len(nugget.doc) for nugget in narrative)
+
+
+# Narratives being edited, by user ID. Those evicted, or idle for long, are saved to the
+# user's directory, and loaded again when the user next accesses them. Idle narratives
+# are found when other narratives are cached, or by `sweep_caches`.
+NARRATIVE_CACHE = SpillCache(
+    path=_narrative_spill_path, dump=binary.dump, load=binary.load,
+    maxsize=int(variables.get('NLG_NARRATIVE_CACHE_SIZE', 256)),
+    maxbytes=int(variables.get('NLG_NARRATIVE_CACHE_BYTES', 256 * 2 ** 20)),
+    ttl=float(variables.get('NLG_NARRATIVE_CACHE_TTL', 3600)),
+    sizeof=_narrative_size)
+# Parsed datasets, by path, modification time and size of the file
+DATASET_CACHE = LRUCache(
+    maxsize=int(variables.get('NLG_DATASET_CACHE_SIZE', 64)),
+    maxbytes=int(variables.get('NLG_DATASET_CACHE_BYTES', 2 ** 30)),
+    sizeof=lambda df: int(df.memory_usage(deep=True).sum()))
+# Saved narratives, by path, for rendering live. Entries are reloaded when the file changes
+COMPILED_CACHE = LRUCache(
+    maxsize=int(variables.get('NLG_COMPILED_CACHE_SIZE', 256)),
+    maxbytes=int(variables.get('NLG_COMPILED_CACHE_BYTES', 256 * 2 ** 20)),
+    sizeof=lambda entry: _narrative_size(entry[1]))
+# Responses of render endpoints by ETag, so that repeated polls needn't render again
+RESPONSE_MEMO = LRUCache(
+    maxsize=int(variables.get('NLG_RESPONSE_MEMO_SIZE', 256)),
+    ttl=float(variables.get('NLG_RESPONSE_MEMO_TTL', 60)))
+# Narratives and nuggets last sent to the IDE, by user and version, so that later
+# versions can be sent as patches against them
+SNAPSHOTS = LRUCache(
+    maxsize=int(variables.get('NLG_SNAPSHOT_CACHE_SIZE', 1024)),
+    ttl=float(variables.get('NLG_SNAPSHOT_CACHE_TTL', 3600)))
+# Converts uploaded datasets to the columnar format in the background
+_CONVERTER = {'executor': None}
+# Locks of the narratives being edited, by user ID. Edits run in the IO loop or WEB_POOL,
+# and renders in WEB_POOL, so both hold the lock of the narrative.
+_NARRATIVE_LOCKS = {}
+_NARRATIVE_LOCKS_LOCK = threading.Lock()
+
+
+class BoundedPool(object):
+    """A thread pool which limits how many calls may wait, and tracks how long they wait.
+
+    Parameters
+    ----------
+    max_workers : int
+        Number of threads.
+    max_queue : int
+        Number of calls that may wait for a thread. Beyond this, `submit` raises an
+        HTTP 503 error.
+    """
+
+    def __init__(self, max_workers, max_queue):
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='nlg-web')
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self.queued = self.running = self.completed = self.rejected = 0
+        self.wait_total = self.wait_max = 0.0
+
+    def submit(self, func, *args, **kwargs):
+        """Run `func(*args, **kwargs)` in the pool. Returns a future."""
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise HTTPError(503, 'Server busy. Please retry.')
+            self.queued += 1
+        return self.executor.submit(self._run, time.time(), func, args, kwargs)
+
+    def _run(self, queued_at, func, args, kwargs):
+        wait = time.time() - queued_at
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    def stats(self):
+        """Get the queue depth, number of calls, and wait times in seconds."""
+        with self._lock:
+            started = self.completed + self.running
+            return {
+                'max_workers': self.max_workers, 'max_queue': self.max_queue,
+                'queued': self.queued, 'running': self.running, 'completed': self.completed,
+                'rejected': self.rejected, 'wait_max': self.wait_max,
+                'wait_mean': self.wait_total / started if started else 0.0,
+            }
+
+
+# Runs NLP and rendering for handlers, so that they don't block the IO loop
+WEB_POOL = BoundedPool(max_workers=int(variables.get('NLG_WEB_WORKERS', 4)),
+                       max_queue=int(variables.get('NLG_WEB_QUEUE', 64)))
+
+
+def offload(func):
+    """Make a FunctionHandler function run in `WEB_POOL` and return a future."""
+    @wraps(func)
+    def wrapper(handler):
+        return WEB_POOL.submit(func, handler)
+    wrapper.sync = func
+    return wrapper
+
+
+def narrative_lock(user_id):
+    """Get the lock of the narrative being edited by a user."""
+    with _NARRATIVE_LOCKS_LOCK:
+        return _NARRATIVE_LOCKS.setdefault(user_id, threading.RLock())
+
+
+@contextmanager
+def editing(user_id, create=False):
+    """Hold the lock of a user's narrative, and yield the narrative to edit it.
+
+    The narrative is cached again afterwards, so that its size is measured again, and
+    edits aren't lost if it was spilled to disk meanwhile. If `create` is True, a new
+    narrative is made if the user has none. Else, a KeyError is raised.
+    """
+    with narrative_lock(user_id):
+        narrative = NARRATIVE_CACHE.get(user_id, None)
+        if narrative is None:
+            if not create:
+                raise KeyError(user_id)
+            narrative = Narrative()
+        yield narrative
+        narrative.revision = uuid.uuid4().hex
+        NARRATIVE_CACHE[user_id] = narrative
+
+
+def revision(narrative):
+    """Get an ID of the current state of a narrative. `editing` changes it on each edit.
+
+    IDs are random, so narratives loaded again from disk, or by other processes, don't
+    reuse the IDs of other states.
+    """
+    if getattr(narrative, 'revision', None) is None:
+        narrative.revision = uuid.uuid4().hex
+    return narrative.revision
+
+
 nlp = utils.load_spacy_model()
 tmpl_loader = Loader(op.join(op.dirname(__file__), "app", "templates"), autoescape=None)
 
@@ -34,8 +198,33 @@ def get_config_modal(handler):
 
 
 def get_narrative_cache(handler):
-    narrative = NARRATIVE_CACHE.get(handler.current_user.id, Narrative())
-    return json.dumps(narrative.to_dict())
+    narrative = NARRATIVE_CACHE.get(handler.current_user.id, Narrative()).to_dict()
+    if '_version' in handler.args:
+        return WEB_POOL.submit(versioned, handler, narrative)
+    return conditional(handler, ['narrative', make_key(narrative)], json.dumps, narrative)
+
+
+def versioned(handler, value):
+    """Send `value` as a JSON patch against the version of it that the client has.
+
+    Clients send the version they have as the `_version` argument, or an empty string
+    if they have none. The response has the `version` of `value`, the `patch` to apply
+    (see `nlg.jsonpatch`), and the `base` version that the patch applies to. If the
+    client's version isn't in `SNAPSHOTS`, `base` is None and the patch replaces the
+    whole document.
+    """
+    user = handler.current_user.id
+    value = json.loads(json.dumps(value))   # Copy, with tuples as lists
+    version = make_key(value)
+    base_version = handler.args['_version'][0]
+    base = SNAPSHOTS.get((user, base_version))
+    SNAPSHOTS[user, version] = value
+    if base is None:
+        base_version = None
+        patch = [{'op': 'replace', 'path': '', 'value': value}]
+    else:
+        patch = jsonpatch.diff(base, value)
+    return {'version': version, 'base': base_version, 'patch': patch}
 
 
 download_narrative = get_narrative_cache
@@ -54,10 +243,11 @@ def new_variable_tmpl(handler):
 
 
 def add_new_variable(handler):
-    nugget = NARRATIVE_CACHE[handler.current_user.id][int(handler.path_args[0])]
     start, end = map(int, handler.path_args[1].split(','))
-    nugget.add_var([start, end], expr=handler.args['expr'][0])
-    return nugget.template
+    with editing(handler.current_user.id) as narrative:
+        nugget = narrative[int(handler.path_args[0])]
+        nugget.add_var([start, end], expr=handler.args['expr'][0])
+        return nugget.template
 
 
 def get_preview_html(template, interactive=False):
@@ -108,8 +298,13 @@ def get_variable_settings_tmpl(handler):
 
 
 def set_variable_settings_tmpl(handler):
+    with editing(handler.current_user.id) as narrative:
+        return _set_variable_settings(handler, narrative)
+
+
+def _set_variable_settings(handler, narrative):
     nugget_id, variable_ix = handler.path_args
-    nugget = NARRATIVE_CACHE[handler.current_user.id][int(nugget_id)]
+    nugget = narrative[int(nugget_id)]
     if not variable_ix.isdigit():
         variable_i = map(int, variable_ix.split(","))
     else:
@@ -143,20 +338,28 @@ def get_nugget_settings_tmpl(handler):
 
 
 def add_condition(handler):
-    nugget = NARRATIVE_CACHE[handler.current_user.id][int(handler.path_args[0])]
-    nugget.condition = handler.args['condition'][0]
+    with editing(handler.current_user.id) as narrative:
+        narrative[int(handler.path_args[0])].condition = handler.args['condition'][0]
 
 
 def get_nugget(handler):
+    """Get a nugget, or delete it and get the narrative.
+
+    If the `_version` argument is set, a patch is made in `WEB_POOL` and returned
+    instead (see `versioned`).
+    """
     nugget_id = int(handler.path_args[0])
     if 'delete' in handler.args:
-        del NARRATIVE_CACHE[handler.current_user.id][nugget_id]
-        return NARRATIVE_CACHE[handler.current_user.id].to_dict()
+        with editing(handler.current_user.id) as narrative:
+            del narrative[nugget_id]
+            result = narrative.to_dict()
     else:
         nugget = NARRATIVE_CACHE[handler.current_user.id][nugget_id]
-        nugget = nugget.to_dict()
-        nugget['previewHTML'] = get_preview_html(nugget, True)
-        return nugget
+        result = nugget.to_dict()
+        result['previewHTML'] = get_preview_html(result, True)
+    if '_version' in handler.args:
+        return WEB_POOL.submit(versioned, handler, result)
+    return result
 
 
 def clean_anonymous_files():
@@ -182,17 +385,117 @@ def get_user_dir(handler):
     return dirpath
 
 
+@offload
 def render_live_template(handler):
-    """Given a narrative ID and df records, render the template."""
-    payload = json.loads(handler.request.body)
-    df = pd.DataFrame.from_records(payload['data'])
-    nrid = payload['nrid']
+    """Given a narrative ID and a dataframe, render the template.
+
+    See `nlg.payload` for the formats that the request body may be in.
+    """
+    payload, df = read_payload(handler, data=True)
+    narrative = read_saved_narrative(_saved_narrative_path(handler, payload['nrid']))
+    return narrative.to_html(**narrative.html_style, df=df, cache=True)
+
+
+def _saved_narrative_path(handler, nrid):
+    # Narratives are read only from the user's own directory
+    nrid = op.basename(nrid)
     if not nrid.endswith('.json'):
         nrid += '.json'
-    with open(op.join(get_user_dir(handler), nrid), 'r', encoding='utf8') as fin:
-        narrative = json.load(fin)
-    narrative = Narrative.from_json(narrative)
-    return narrative.to_html(**narrative.html_style, df=df)
+    return op.join(get_user_dir(handler), nrid)
+
+
+def read_saved_narrative(path):
+    """Load a saved narrative, reusing the one in `COMPILED_CACHE` if the file is unchanged.
+
+    The cached narrative is shared by all requests, so it must not be modified.
+    """
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    entry = COMPILED_CACHE.get(path)
+    if entry is not None and entry[0] == signature:
+        return entry[1]
+    with open(path, 'r', encoding='utf8') as fin:
+        narrative = Narrative.from_json(json.load(fin))
+    COMPILED_CACHE[path] = signature, narrative
+    return narrative
+
+
+def _jsonable(value):
+    # Convert numpy scalars, like partition keys, to Python types
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _iter_batch(handler, payload, df):
+    """Render a saved narrative for each item of a batch. Yields JSON lines."""
+    narrative = read_saved_narrative(_saved_narrative_path(handler, payload['nrid']))
+    if df is None:
+        df = read_dataset(op.join(get_user_dir(handler), op.basename(payload['dataset'])))
+    partition = payload.get('partition')
+    if partition:
+        # Split the data once, instead of filtering it for each item
+        cols = [partition] if isinstance(partition, str) else list(partition)
+        items = (
+            (dict(zip(cols, map(_jsonable, key if isinstance(key, tuple) else (key,)))),
+             {'df': group})
+            for key, group in df.groupby(cols, sort=False))
+    else:
+        items = ((args, {'df': df, 'fh_args': args}) for args in payload.get('fh_args', []))
+    for i, (key, kwargs) in enumerate(items):
+        line = {'index': i, 'key': key}
+        try:
+            line['html'] = narrative.to_html(**narrative.html_style, cse=True, **kwargs)
+        except Exception as exc:
+            line['error'] = f'{type(exc).__name__}: {exc}'
+        yield json.dumps(line) + '\n'
+
+
+def _stream_lines(handler, lines):
+    handler.set_header('Content-Type', 'application/x-ndjson; charset=UTF-8')
+    while True:
+        future = WEB_POOL.submit(next, lines, None)
+        yield future
+        # FunctionHandler has resolved the future before asking for the next one
+        if future.result() is None:
+            return
+
+
+def render_batch(handler):
+    """Render a saved narrative for many filters, or for each partition of a dataset.
+
+    The request body has the narrative ID as ``nrid``, and the data (see `nlg.payload`),
+    or the name of a dataset in the user's directory as ``dataset``. It also has either
+
+    - ``fh_args``: a list of FormHandler arguments. Each is applied to all nuggets.
+    - ``partition``: a column name or list of names. The narrative is rendered for each
+      distinct value of these columns, on the rows that have that value.
+
+    Returns one JSON object per line, with the ``index`` of the item, its ``key`` (the
+    FormHandler arguments or the partition values), and the ``html`` rendered, or an
+    ``error``. If the `_stream` argument is set, lines are streamed as they are rendered.
+    """
+    payload, df = read_payload(handler)
+    if df is None and 'dataset' not in payload:
+        raise HTTPError(400, 'Send the data, or the name of a dataset.')
+    lines = _iter_batch(handler, payload, df)
+    if handler.args.pop('_stream', [''])[0]:
+        return _stream_lines(handler, lines)
+    return WEB_POOL.submit(''.join, lines)
+
+
+def read_payload(handler, data=False):
+    """Read the fields and dataframe posted to a handler. See `nlg.payload.read`.
+
+    Raises an HTTP 400 error if the payload can't be read, or if `data` is True and it
+    has no data.
+    """
+    content_type = handler.request.headers.get('Content-Type', '')
+    try:
+        payload, df = _read_body(handler.request.body, content_type)
+    except (ValueError, KeyError) as exc:
+        raise HTTPError(400, f'Cannot read payload: {exc}')
+    if data and df is None:
+        raise HTTPError(400, 'Payload has no data.')
+    return payload, df
 
 
 def get_style_kwargs(handler_args):
@@ -204,51 +507,268 @@ def get_style_kwargs(handler_args):
     return style_kwargs
 
 
+def _html_style(style_kwargs):
+    """Get the style of a preview from the style arguments of the request."""
+    return {k: style_kwargs.get(k, v) for k, v in Narrative.default_style.items()}
+
+
+def _preview_style(narrative, style_kwargs):
+    """Get the style of a preview, and save it as the style of the narrative."""
+    narrative.html_style = style = _html_style(style_kwargs)
+    return style
+
+
+def _iter_narrative_html(handler, narrative, style_kwargs):
+    orgdf = get_original_df(handler, narrative.columns)
+    yield from narrative.iter_html(**style_kwargs, df=orgdf, cache=True)
+
+
+def _next_locked(lock, chunks):
+    with lock:
+        return next(chunks, '')
+
+
+def _stream_html(handler, narrative):
+    """Write the HTML of a narrative to the client one nugget at a time.
+
+    Each chunk is rendered in `WEB_POOL`. The list markup adds at most 2 chunks.
+    """
+    handler.set_header('Content-Type', 'text/html; charset=UTF-8')
+    lock = narrative_lock(handler.current_user.id)
+    style_kwargs = get_style_kwargs(handler.args)
+    with lock:
+        _preview_style(narrative, style_kwargs)
+        # Nuggets moved or deleted while streaming don't change what's streamed
+        narrative = Narrative(narrative)
+    chunks = _iter_narrative_html(handler, narrative, style_kwargs)
+    for _ in range(len(narrative) + 2):
+        yield WEB_POOL.submit(_next_locked, lock, chunks)
+
+
 def render_narrative(handler):
-    orgdf = get_original_df(handler)
+    """Render the narrative being edited by the user.
+
+    Returns the HTML and the style of the narrative as JSON. If the `_stream` argument
+    is set, the HTML alone is streamed to the client one nugget at a time, instead.
+    If the `_values` argument is set, only the values of variables are returned (see
+    `nlg.narrative.Narrative.render_values`). Rendering runs in `WEB_POOL`. Responses
+    that aren't streamed have an ETag (see `conditional`).
+    """
+    narrative = NARRATIVE_CACHE.get(handler.current_user.id, False)
+    if handler.args.pop('_stream', [''])[0]:
+        return _stream_html(handler, narrative) if narrative else ''
+    if narrative and not handler.args.get('_values', [''])[0]:
+        # Save the style the user sees, even if the response is a 304 or a memo hit
+        with narrative_lock(handler.current_user.id):
+            _preview_style(narrative, get_style_kwargs(dict(handler.args)))
+    parts = ['renderall', revision(narrative) if narrative else None,
+             _dataset_signature(handler), handler.args]
+    return conditional(handler, parts, _render_narrative, handler)
+
+
+def _render_narrative(handler):
+    with narrative_lock(handler.current_user.id):
+        return _render_narrative_locked(handler)
+
+
+def _render_narrative_locked(handler):
+    values_only = handler.args.pop('_values', [''])[0]
     narrative = NARRATIVE_CACHE.get(handler.current_user.id, False)
     if narrative:
+        orgdf = get_original_df(handler, narrative.columns)
+        if values_only:
+            return json.dumps(narrative.render_values(orgdf))
         style_kwargs = get_style_kwargs(handler.args)
-        pl = {'render': narrative.to_html(**style_kwargs, df=orgdf),
-              'style': narrative.html_style}
+        pl = {'render': narrative.to_html(**style_kwargs, df=orgdf, cache=True),
+              'style': _html_style(style_kwargs)}
     else:
         pl = {'render': '', 'style': Narrative.default_style}
     return pl
 
 
-def get_original_df(handler):
-    """Get the original dataframe which was uploaded to the webapp."""
+def get_original_df(handler, columns=None):
+    """Get the original dataframe which was uploaded to the webapp.
+
+    Parameters
+    ----------
+    handler : tornado.RequestHandler
+    columns : set, optional
+        If specified, only these columns are read from the dataset.
+        (See `nlg.narrative.Narrative.columns`)
+    """
+    path = _dataset_path(handler)
+    if path:
+        df = read_dataset(path)
+        if columns:
+            df = df[[c for c in df.columns if c in columns]]
+        return df
+
+
+def _dataset_path(handler):
     data_dir = get_user_dir(handler)
     meta_path = op.join(data_dir, 'meta.cfg')
     if op.isfile(meta_path):
         with open(meta_path, 'r') as fout:  # noqa: No encoding for json
             meta = json.load(fout)
-        dataset_path = op.join(data_dir, meta['dsid'])
-        return pd.read_csv(dataset_path, encoding='utf-8')
+        return op.join(data_dir, meta['dsid'])
+
+
+def _dataset_signature(handler):
+    path = _dataset_path(handler)
+    if path and op.isfile(path):
+        stat = os.stat(path)
+        return [path, stat.st_mtime_ns, stat.st_size]
+
+
+def _etag_matches(handler, etag):
+    header = handler.request.headers.get('If-None-Match', '')
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+
+def _memoize(etag, func, *args):
+    result = func(*args)
+    RESPONSE_MEMO[etag] = result
+    return result
+
+
+def conditional(handler, parts, func, *args):
+    """Respond with an ETag made from `parts`, and render with `func(*args)` only if needed.
+
+    `parts` must identify the response, e.g. with the version of the narrative and the
+    signature of the dataset. They are hashed with the user's ID. If the request's
+    If-None-Match header has the ETag, the response is a 304 with no body. Else, if the
+    response is in `RESPONSE_MEMO`, it is returned. Else `func(*args)` runs in
+    `WEB_POOL`.
+    """
+    etag = make_key(handler.current_user.id, *parts)
+    if etag is None:
+        return WEB_POOL.submit(func, *args)
+    etag = f'"{etag}"'
+    handler.set_header('ETag', etag)
+    if _etag_matches(handler, etag):
+        handler.set_status(304)
+        return None
+    result = RESPONSE_MEMO.get(etag)
+    if result is not None:
+        return result
+    return WEB_POOL.submit(_memoize, etag, func, *args)
+
+
+def _columnar_path(path):
+    """Path to the columnar copy of a dataset. See `nlg.columnar`."""
+    return op.join(op.dirname(path), '.cache', op.basename(path) + '.npy')
+
+
+def read_dataset(path):
+    """Read a dataset, reusing the parsed dataframe if the file hasn't changed.
+
+    Dataframes are cached in `DATASET_CACHE` against the path, modification time and
+    size of the file. They are shared between requests, and must not be modified.
+    If the dataset has been converted to the columnar format (see `convert_dataset`),
+    it is loaded from there, memory-mapped, instead of being parsed.
+
+    Parameters
+    ----------
+    path : str
+        Path to the dataset.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    df = DATASET_CACHE.get(key)
+    if df is None:
+        cpath = _columnar_path(path)
+        if columnar.is_fresh(cpath, path):
+            df = columnar.load(cpath)
+        else:
+            df = pd.read_csv(path, encoding='utf-8')
+        # Drop older versions of the same file
+        for old, _ in DATASET_CACHE.items():
+            if old[0] == path:
+                DATASET_CACHE.pop(old)
+        DATASET_CACHE[key] = df
+    return df
+
+
+def convert_dataset(path):
+    """Read a dataset into `DATASET_CACHE` and save it in the columnar format, if it
+    hasn't been already. See `read_dataset`."""
+    cpath = _columnar_path(path)
+    if not columnar.is_fresh(cpath, path):
+        columnar.save(read_dataset(path), cpath, src=path)
+        app_log.debug(f'Converted {path} to {cpath}')
+
+
+def _log_conversion_error(future):
+    exc = future.exception()
+    if exc is not None:
+        app_log.warning(f'Cannot convert dataset: {exc}')
+
+
+def convert_dataset_async(path):
+    """Run `convert_dataset` in a background thread. Returns a future."""
+    if _CONVERTER['executor'] is None:
+        _CONVERTER['executor'] = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='nlg-convert')
+    future = _CONVERTER['executor'].submit(convert_dataset, path)
+    future.add_done_callback(_log_conversion_error)
+    return future
 
 
 def render_template(handler):
     """Render a set of templates against a dataframe and formhandler actions on it."""
-    orgdf = get_original_df(handler)
-    nugget = NARRATIVE_CACHE[handler.current_user.id][int(handler.path_args[0])]
-    return nugget.render(orgdf)
+    narrative = NARRATIVE_CACHE[handler.current_user.id]
+    nugget = narrative[int(handler.path_args[0])]
+    parts = ['rendertmpl', revision(narrative), handler.path_args[0],
+             _dataset_signature(handler)]
+    return conditional(handler, parts, _render_template, handler, nugget)
+
+
+def _render_template(handler, nugget):
+    with narrative_lock(handler.current_user.id):
+        orgdf = get_original_df(handler, nugget.columns)
+        return nugget.render(orgdf, cache=True)
+
+
+def sweep_caches():
+    """Remove expired entries from the caches, saving idle narratives to disk.
+
+    Scheduled in gramex.yaml.
+    """
+    for cache in (NARRATIVE_CACHE, RESPONSE_MEMO, SNAPSHOTS, RENDER_CACHE):
+        cache.sweep()
+
+
+def get_pool_stats(handler):
+    """Get the queue depth and wait times of `WEB_POOL`."""
+    return json.dumps(WEB_POOL.stats())
+
+
+def get_render_cache_stats(handler):
+    """Get the size and hit, miss and eviction counts of the render, narrative,
+    compiled narrative, dataset and response caches."""
+    return json.dumps({'render': RENDER_CACHE.stats(), 'narrative': NARRATIVE_CACHE.stats(),
+                       'compiled': COMPILED_CACHE.stats(), 'dataset': DATASET_CACHE.stats(),
+                       'response': RESPONSE_MEMO.stats()})
 
 
 def save_nugget(sid, nugget):
-    narrative = NARRATIVE_CACHE.get(sid, Narrative())
-    narrative.append(nugget)
-    if len(narrative) > 0:
-        NARRATIVE_CACHE[sid] = narrative
+    with editing(sid, create=True) as narrative:
+        narrative.append(nugget)
     # outpath = op.join(nlg_path, sid + ".json")
     # with open(outpath, 'w', encoding='utf8') as fout:
     #     json.dump([n.to_dict() for n in narrative], fout, indent=4)
 
 
+@offload
 def process_text(handler):
     """Process English text in the context of a df and formhandler arguments
-    to templatize it."""
-    payload = json.loads(handler.request.body.decode('utf8'))
-    df = pd.DataFrame.from_records(payload['data'])
+    to templatize it. See `nlg.payload` for the formats of the request body."""
+    payload, df = read_payload(handler, data=True)
     args = payload.get('args', {}) or {}
     nugget = templatize(nlp(payload['text']), args.copy(), df)
     save_nugget(handler.current_user.id, nugget)
@@ -320,6 +840,7 @@ def init_form(handler):
         outpath = op.join(data_dir, dataset)
     # shutil.copy(outpath, fh_fpath)
     meta['dsid'] = op.basename(outpath)
+    convert_dataset_async(outpath)
 
     # handle config
     config_name = handler.get_argument('narrative', '')
@@ -342,6 +863,7 @@ def init_form(handler):
         json.dump(meta, fout, indent=4)
 
 
+@offload
 def get_init_config(handler):
     """Get the initial default configuration for the current user."""
     user_dir = get_user_dir(handler)
@@ -355,14 +877,11 @@ def get_init_config(handler):
         if op.isfile(config_file):
             with open(config_file, 'r') as fout:  # NOQA: no encoding for JSON
                 meta['config'] = json.load(fout)
-            global NARRATIVE_CACHE
-            NARRATIVE_CACHE = {}
-            NARRATIVE_CACHE[handler.current_user.id] = \
-                Narrative.from_json(meta['config'])
+            narrative = Narrative.from_json(meta['config'])
+            with narrative_lock(handler.current_user.id):
+                NARRATIVE_CACHE[handler.current_user.id] = narrative
             app_log.debug('Initial config loaded from {}'.format(config_file))
-            return {
-                'style': NARRATIVE_CACHE[handler.current_user.id].html_style,
-                'nrid': narrative_name}
+            return {'style': narrative.html_style, 'nrid': narrative_name}
     return {}
 
 
@@ -372,12 +891,12 @@ def save_narrative(handler):
         name += '.json'
     outpath = op.join(get_user_dir(handler), name)
     with open(outpath, 'w', encoding='utf8') as fout:
-        json.dump(NARRATIVE_CACHE[handler.current_user.id].to_dict(),
+        json.dump(NARRATIVE_CACHE[handler.current_user.id].to_dict(doc=True),
                   fout, indent=4)
+    COMPILED_CACHE.pop(outpath)
 
 
 def move_nuggets(handler):
     pop, drop = map(int, handler.path_args)
-    narrative = NARRATIVE_CACHE[handler.current_user.id]
-    popped = narrative.pop(pop)
-    narrative.insert(drop, popped)
+    with editing(handler.current_user.id) as narrative:
+        narrative.insert(drop, narrative.pop(pop))